@@ -0,0 +1,152 @@
+"""
+Helpers shared by the collector scripts.
+Each script puts the repository root on sys.path before importing this module,
+so it can still be run from its own directory.
+"""
+
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+import pathlib
+import queue
+import random
+import sys
+from typing import Callable, Dict, Hashable, Iterator, Optional
+
+# Longest wait before a retry, whatever Retry-After asks for
+MAX_RETRY_DELAY = 60
+
+def retry_delay(headers, backoff: float) -> float:
+	"""
+	Seconds to wait before retrying: the server's Retry-After when it gives one in
+	seconds, otherwise the backoff, capped at MAX_RETRY_DELAY. Jitter of up to the
+	backoff again is added so concurrent retries don't all land at once.
+	"""
+	try:
+		delay = float(headers.get('Retry-After', backoff))
+	except ValueError:
+		# Retry-After can also be an HTTP date; fall back to the backoff
+		delay = backoff
+	return min(max(delay, 0.0), MAX_RETRY_DELAY) + random.random() * backoff
+
+def conditional_headers(stored: Optional[Dict]) -> Optional[Dict]:
+	"""
+	Build If-None-Match/If-Modified-Since headers from a stored validator entry.
+	"""
+	if not stored:
+		return None
+	headers = {}
+	if stored['etag']:
+		headers['If-None-Match'] = stored['etag']
+	if stored['last_modified']:
+		headers['If-Modified-Since'] = stored['last_modified']
+	return headers
+
+def remember_validators(validators, key: str, response, body: bytes):
+	"""
+	Store a live response's ETag/Last-Modified and body, so the next run can
+	revalidate it instead of downloading it again.
+	"""
+	etag = response.headers.get('ETag')
+	last_modified = response.headers.get('Last-Modified')
+	if etag or last_modified:
+		validators[key] = {'etag': etag, 'last_modified': last_modified, 'body': body}
+
+async def refresh_cached_response(session, url: str, params: Optional[Dict], response, body: bytes):
+	"""
+	Put a GET answered with 304 back into an aiohttp-client-cache session's cache as a
+	200 carrying the stored body, so it is served from the cache again until it next
+	expires rather than revalidated (and rate limited) on every run.
+	"""
+	# Imported here so collectors that don't use aiohttp-client-cache can still use this module
+	from aiohttp_client_cache.cache_control import get_expiration_datetime
+	from aiohttp_client_cache.response import CachedResponse
+	
+	cached = await CachedResponse.from_client_response(response, get_expiration_datetime(session.cache.expire_after))
+	cached.status = 200
+	cached.reason = 'OK'
+	cached._body = body
+	await session.cache.responses.write(session.cache.create_key('GET', url, params=params), cached)
+
+def load_results(path: str) -> Iterator[Dict]:
+	"""
+	Read species records back from a results file, one line at a time.
+	"""
+	with open(path, 'rb') as f:
+		for line in f:
+			yield orjson.loads(line)
+
+class ResultStream:
+	"""
+	Species records appended one per line as they are collected, so an interrupted
+	run can pick up where it left off. key gives the value identifying a record as
+	collected; those of every record written so far are kept in collected.
+	"""
+	
+	def __init__(self, path: str, key: Callable[[Dict], Hashable]):
+		self.path = pathlib.Path(path)
+		self.key = key
+		self.collected = set()
+		self._out = None
+	
+	def resume(self, replay: Callable[[Dict], None]):
+		"""
+		Pass each record of a previous run's stream to replay, then open the stream
+		for appending.
+		"""
+		if self.path.exists():
+			data = self.path.read_bytes()
+			complete = data[:data.rfind(b'\n') + 1]
+			if complete != data:
+				# Drop a record cut short by a crash
+				self.path.write_bytes(complete)
+			
+			for species in load_results(self.path):
+				self.collected.add(self.key(species))
+				replay(species)
+			
+			if self.collected:
+				print(f"Resuming: {len(self.collected)} species already collected in {self.path}")
+		
+		self._out = open(self.path, 'ab', buffering=0)
+	
+	def record(self, species: Dict):
+		"""
+		Append one species record to the stream.
+		"""
+		self._out.write(orjson.dumps(species, option=orjson.OPT_NON_STR_KEYS) + b'\n')
+		self.collected.add(self.key(species))
+	
+	def save(self, filename: str, header: Dict):
+		"""
+		Write the header fields and every record as one JSON document under "species".
+		Records are copied line by line, and the stream is removed afterwards.
+		"""
+		self._out.close()
+		
+		header = orjson.dumps(header)
+		with open(filename, 'wb') as f, open(self.path, 'rb') as records:
+			f.write(header[:-1] + b',"species":[\n')
+			for i, line in enumerate(records):
+				if i:
+					f.write(b',\n')
+				f.write(line.rstrip(b'\n'))
+			f.write(b'\n]}\n')
+		
+		self.path.unlink()
+
+def start_logging(logger: logging.Logger, level: int = logging.INFO) -> QueueListener:
+	"""
+	Send a logger's records through a queue to stdout, so writing them never
+	blocks the event loop. Returns the running listener; stop it when done.
+	"""
+	log_queue = queue.Queue(-1)
+	handler = logging.StreamHandler(sys.stdout)
+	handler.setFormatter(logging.Formatter('%(message)s'))
+	
+	logger.addHandler(QueueHandler(log_queue))
+	logger.setLevel(level)
+	
+	listener = QueueListener(log_queue, handler)
+	listener.start()
+	return listener
@@ -1,16 +1,55 @@
 #!/usr/bin/env python3
 """
 Script to collect bee occurrence data from GBIF API.
-Requires: requests library (pip install requests)
+Requires: aiohttp, aiohttp-client-cache, aiolimiter, orjson libraries (pip install aiohttp aiohttp-client-cache[sqlite] aiolimiter orjson)
 """
 
-import requests
-import json
-import time
+import aiohttp
+import asyncio
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from aiolimiter import AsyncLimiter
+import heapq
+import orjson
+import pathlib
+import sys
+from collections import Counter
 from typing import List, Dict, Optional
 from datetime import datetime
 
+# Helpers shared by the collectors live at the top of the repository
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from api_helpers import ResultStream, retry_delay
+
+# Cap on open GBIF connections, and the request rate shared by every worker
+MAX_CONCURRENT_REQUESTS = 10
+GBIF_REQUESTS_PER_SECOND = 10
+
+# Transient statuses worth retrying, with exponential backoff between attempts
+# unless the server says how long to wait with Retry-After
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+# On-disk response cache; species and family lookups are effectively static,
+# occurrence searches change as new records are published
+CACHE_NAME = 'gbif_cache'
+CACHE_EXPIRE_AFTER = 86400 * 7
+CACHE_URLS_EXPIRE_AFTER = {
+	'api.gbif.org/v1/occurrence/search': 3600,
+	'api.gbif.org/v1/species': 86400 * 30
+}
+
+# Species records are appended here as they are collected, so an interrupted
+# run keeps its progress; save_results folds the file into the final JSON
+RESULTS_STREAM = 'gbif_bees.ndjson'
+
+# IUCN Red List categories, in the order they are searched and reported
+IUCN_CATEGORY_ORDER = ('EX', 'EW', 'CR', 'EN', 'VU', 'NT')
+
 class GBIFBeeData:
+	# Family taxon keys never change, so they are kept on disk between runs
+	_FAMILY_KEYS_CACHE = pathlib.Path(__file__).with_suffix('.family_keys.json')
+	
 	def __init__(self):
 		self.base_url = "https://api.gbif.org/v1"
 		
@@ -26,30 +65,101 @@ class GBIFBeeData:
 		]
 		
 		# IUCN Red List categories we care about
-		self.target_iucn_categories = ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']
-		self.iucn_categories = ['EXTINCT', 'EXTINCT_IN_THE_WILD', 'REGIONALLY_EXTINCT', 'CRITICALLY_ENDANGERED', 'ENDANGERED', 'VULNERABLE', 'NEAR_THREATENED']
+		self.target_iucn_categories = frozenset(IUCN_CATEGORY_ORDER)
+		self.iucn_categories = frozenset(('EXTINCT', 'EXTINCT_IN_THE_WILD', 'REGIONALLY_EXTINCT', 'CRITICALLY_ENDANGERED', 'ENDANGERED', 'VULNERABLE', 'NEAR_THREATENED'))
 		
 		# Cache for family taxon keys
-		self.family_keys = {}
+		self.family_keys = orjson.loads(self._FAMILY_KEYS_CACHE.read_bytes()) if self._FAMILY_KEYS_CACHE.exists() else {}
+		
+		# Token bucket pacing every request that actually goes out to GBIF
+		self.gbif_limit = AsyncLimiter(GBIF_REQUESTS_PER_SECOND, 1)
+		
+		# Requests wait here rather than in the connection pool, so queueing time
+		# doesn't count against a request's timeout
+		self.request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 		
-		self.results = []
+		# Running totals for print_summary, so records don't have to be kept in memory
+		self.family_counts = Counter()
+		self.iucn_counts = Counter()
+		self.stats = Counter()
+		self.top_species = []  # min-heap of the 5 species with the most occurrences
+		
+		# Pick up where an interrupted run left off
+		self.stream = ResultStream(RESULTS_STREAM, key=lambda s: (s.get('scientific_name'), s.get('iucn_category')))
+		self.stream.resume(self._update_stats)
+	
+	def _update_stats(self, species: Dict):
+		"""
+		Fold one species record into the running summary totals.
+		"""
+		occurrences = species.get('total_occurrences', 0)
+		
+		self.family_counts[species.get('family', 'Unknown')] += 1
+		self.iucn_counts[species.get('iucn_category', 'Unknown')] += 1
+		self.stats['species'] += 1
+		self.stats['occurrences'] += occurrences
+		if occurrences > 0:
+			self.stats['with_occurrences'] += 1
+		
+		recent = species.get('recent_occurrences')
+		entry = (
+			occurrences,
+			-self.stats['species'],  # ties go to the earlier record
+			species['scientific_name'],
+			species['family'],
+			species['iucn_category'],
+			recent[0] if recent else None
+		)
+		if len(self.top_species) < 5:
+			heapq.heappush(self.top_species, entry)
+		else:
+			heapq.heappushpop(self.top_species, entry)
 	
-	def get_species_info(self, species_key: int) -> Optional[Dict]:
+	def record_result(self, species: Dict):
+		"""
+		Append one species record to the results stream and the running totals.
+		"""
+		self.stream.record(species)
+		self._update_stats(species)
+	
+	async def _fetch_json(self, session: aiohttp.ClientSession, url: str, params: Optional[Dict] = None) -> Dict:
+		"""
+		GET a URL and decode its JSON body.
+		At most MAX_CONCURRENT_REQUESTS are in flight; rate limiting happens in
+		_wait_for_rate_limit, as requests leave the cache.
+		Transient errors (RETRY_STATUSES) are retried up to MAX_RETRIES times.
+		Raises aiohttp.ClientResponseError on a non-200 response.
+		"""
+		for attempt in range(MAX_RETRIES + 1):
+			async with self.request_slots:
+				async with session.get(url, params=params) as response:
+					if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+						response.raise_for_status()
+						return await response.json()
+					delay = retry_delay(response.headers, RETRY_BACKOFF * 2 ** attempt)
+			await asyncio.sleep(delay)
+	
+	async def _wait_for_rate_limit(self, session, trace_config_ctx, params):
+		"""
+		Request-start trace hook: take a token from the GBIF limiter.
+		Cache hits never start a real request, so they aren't rate limited.
+		"""
+		await self.gbif_limit.acquire()
+	
+	async def get_species_info(self, session: aiohttp.ClientSession, species_key: int) -> Optional[Dict]:
 		"""
 		Get basic species information from a species key.
 		"""
 		endpoint = f"{self.base_url}/species/{species_key}"
 		
 		try:
-			response = requests.get(endpoint, timeout=30)
-			if response.status_code == 200:
-				return response.json()
-		except requests.exceptions.RequestException:
+			return await self._fetch_json(session, endpoint)
+		except (aiohttp.ClientError, asyncio.TimeoutError):
 			pass
 		
 		return None
 	
-	def get_family_taxon_key(self, family_name: str) -> Optional[int]:
+	async def get_family_taxon_key(self, session: aiohttp.ClientSession, family_name: str) -> Optional[int]:
 		"""
 		Get the GBIF taxonKey for a bee family.
 		"""
@@ -64,26 +174,25 @@ class GBIFBeeData:
 		}
 		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				if data.get('matchType') in ['EXACT', 'FUZZY']:
-					taxon_key = data.get('usageKey')
-					self.family_keys[family_name] = taxon_key
-					return taxon_key
-				else:
-					print(f"  Warning: Could not find exact match for {family_name}")
+			data = await self._fetch_json(session, endpoint, params)
+			if data.get('matchType') in ['EXACT', 'FUZZY']:
+				taxon_key = data.get('usageKey')
+				self.family_keys[family_name] = taxon_key
+				self._FAMILY_KEYS_CACHE.write_bytes(orjson.dumps(self.family_keys))
+				return taxon_key
 			else:
-				print(f"  Error getting taxon key for {family_name}: HTTP {response.status_code}")
-		except requests.exceptions.RequestException as e:
-			print(f"  Request error for {family_name}: {e}")
+				print(f"  Warning: Could not find exact match for {family_name}")
+		except aiohttp.ClientResponseError as e:
+			print(f"  Error getting taxon key for {family_name}: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			print(f"  Request error for {family_name}: {e!r}")
 		
 		return None
 	
-	def search_occurrences_by_species(self, scientific_name: str, iucn_category: str = None) -> Dict:
+	async def search_occurrences_by_species(self, session: aiohttp.ClientSession, scientific_name: str, iucn_category: str = None) -> Optional[Dict]:
 		"""
 		Search for occurrences of a specific species.
-		Returns summary statistics and recent occurrences.
+		Returns summary statistics and recent occurrences, or None if the search failed.
 		"""
 		endpoint = f"{self.base_url}/occurrence/search"
 		
@@ -99,167 +208,239 @@ class GBIFBeeData:
 			params['iucnRedListCategory'] = iucn_category
 		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				
-				total_count = data.get('count', 0)
-				results = data.get('results', [])
-				
-				# Extract 5 most recent occurrences that are not human observations.
-				# Most human observations come from iNaturalist database, whose API is being queried separately
-				occurrences = []
-				for occ in [r for r in results if r.get('basisOfRecord') != 'HUMAN_OBSERVATION'][:5]:  # Just keep 5 most recent
-					occurrences.append({
-						'gbif_id': occ.get('key'),
-						'date': occ.get('eventDate'),
-						'year': occ.get('year'),
-						'country': occ.get('country'),
-						'state_province': occ.get('stateProvince'),
-						'locality': occ.get('locality'),
-						'latitude': occ.get('decimalLatitude'),
-						'longitude': occ.get('decimalLongitude'),
-						'basis_of_record': occ.get('basisOfRecord'),
-						'dataset_key': occ.get('datasetKey'),
-						'institution_code': occ.get('institutionCode')
-					})
-				
-				return {
-					'total_occurrences': total_count,
-					'recent_occurrences': occurrences
-				}
-			else:
-				print(f"    Error searching occurrences: HTTP {response.status_code}")
-		except requests.exceptions.RequestException as e:
-			print(f"    Request error: {e}")
+			data = await self._fetch_json(session, endpoint, params)
+			
+			total_count = data.get('count', 0)
+			results = data.get('results', [])
+			
+			# Extract 5 most recent occurrences that are not human observations.
+			# Most human observations come from iNaturalist database, whose API is being queried separately
+			occurrences = []
+			for occ in [r for r in results if r.get('basisOfRecord') != 'HUMAN_OBSERVATION'][:5]:  # Just keep 5 most recent
+				occurrences.append({
+					'gbif_id': occ.get('key'),
+					'date': occ.get('eventDate'),
+					'year': occ.get('year'),
+					'country': occ.get('country'),
+					'state_province': occ.get('stateProvince'),
+					'locality': occ.get('locality'),
+					'latitude': occ.get('decimalLatitude'),
+					'longitude': occ.get('decimalLongitude'),
+					'basis_of_record': occ.get('basisOfRecord'),
+					'dataset_key': occ.get('datasetKey'),
+					'institution_code': occ.get('institutionCode')
+				})
+			
+			return {
+				'total_occurrences': total_count,
+				'recent_occurrences': occurrences
+			}
+		except aiohttp.ClientResponseError as e:
+			print(f"    Error searching occurrences for {scientific_name}: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			print(f"    Request error for {scientific_name}: {e!r}")
+		
+		return None
+	
+	async def get_species_counts_for_category(self, session: aiohttp.ClientSession, family_key: int, iucn_cat: str) -> List[Dict]:
+		"""
+		Get the speciesKey facet counts for one IUCN category within a family.
+		"""
+		endpoint = f"{self.base_url}/occurrence/search"
+		params = {
+			'familyKey': family_key,
+			'iucnRedListCategory': iucn_cat,
+			'facet': 'speciesKey',
+			'facetLimit': 10000,  # Max species per category
+			'limit': 0  # We don't need actual occurrence records, just facet counts
+		}
 		
-		return {'total_occurrences': 0, 'recent_occurrences': []}
+		try:
+			data = await self._fetch_json(session, endpoint, params)
+			
+			# Get species from facets
+			for facet in data.get('facets', []):
+				if facet.get('field') == 'SPECIES_KEY':
+					counts = facet.get('counts', [])
+					print(f"  {iucn_cat}: Found {len(counts)} species")
+					return counts
+		except aiohttp.ClientResponseError as e:
+			print(f"  Error for {iucn_cat}: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			print(f"  Request error for {iucn_cat}: {e!r}")
+		
+		return []
 	
-	def get_threatened_species_in_family(self, family_key: int, family_name: str) -> List[Dict]:
+	async def get_populated_categories(self, session: aiohttp.ClientSession, family_key: int) -> List[str]:
+		"""
+		Get the target IUCN categories that have any occurrences within a family.
+		Uses a single iucnRedListCategory facet query, so empty categories can be
+		skipped without a per-category request. Falls back to every target category
+		if the query fails.
+		"""
+		endpoint = f"{self.base_url}/occurrence/search"
+		params = {
+			'familyKey': family_key,
+			'facet': 'iucnRedListCategory',
+			'limit': 0  # Only the facet counts are needed
+		}
+		
+		try:
+			data = await self._fetch_json(session, endpoint, params)
+			
+			for facet in data.get('facets', []):
+				if facet.get('field') == 'IUCN_RED_LIST_CATEGORY':
+					populated = {c.get('name') for c in facet.get('counts', []) if c.get('count', 0) > 0}
+					return [cat for cat in IUCN_CATEGORY_ORDER if cat in self.target_iucn_categories and cat in populated]
+			return []
+		except aiohttp.ClientResponseError as e:
+			print(f"  Error getting IUCN category counts: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			print(f"  Request error getting IUCN category counts: {e!r}")
+		
+		return [cat for cat in IUCN_CATEGORY_ORDER if cat in self.target_iucn_categories]
+	
+	async def get_threatened_species_in_family(self, session: aiohttp.ClientSession, family_key: int, family_name: str) -> List[Dict]:
 		"""
 		Get all threatened species within a family using occurrence search with facets.
 		This is more efficient than searching species lists.
 		"""
 		print(f"\nSearching GBIF occurrences for threatened species in {family_name}...")
 		
-		endpoint = f"{self.base_url}/occurrence/search"
+		# Most families have no species at all in several categories; skip those
+		categories = await self.get_populated_categories(session, family_key)
+		
+		# GBIF facets are one-dimensional, so species keys can't be broken down by
+		# category in a single query. Search every remaining category at once instead.
+		category_counts = await asyncio.gather(*(
+			self.get_species_counts_for_category(session, family_key, iucn_cat)
+			for iucn_cat in categories
+		))
+		
+		facet_rows = [
+			(iucn_cat, count_obj.get('name'), count_obj.get('count', 0))
+			for iucn_cat, counts in zip(categories, category_counts)
+			for count_obj in counts
+		]
+		
+		# Get species names from the keys, all at once
+		species_infos = await asyncio.gather(*(
+			self.get_species_info(session, species_key) for _, species_key, _ in facet_rows
+		))
 		
 		threatened_species = []
 		
-		# Search for each IUCN category separately to get species lists
-		for iucn_cat in self.target_iucn_categories:
-			params = {
-				'familyKey': family_key,
-				'iucnRedListCategory': iucn_cat,
-				'facet': 'speciesKey',
-				'facetLimit': 10000,  # Max species per category
-				'limit': 0  # We don't need actual occurrence records, just facet counts
-			}
-			
-			try:
-				response = requests.get(endpoint, params=params, timeout=30)
-				if response.status_code == 200:
-					data = response.json()
-					
-					# Get species from facets
-					facets = data.get('facets', [])
-					for facet in facets:
-						if facet.get('field') == 'SPECIES_KEY':
-							counts = facet.get('counts', [])
-							print(f"  {iucn_cat}: Found {len(counts)} species")
-							
-							for count_obj in counts:
-								species_key = count_obj.get('name')
-								occurrence_count = count_obj.get('count', 0)
-								
-								# Get species name from the key
-								species_info = self.get_species_info(species_key)
-								if species_info:
-									threatened_species.append({
-										'scientific_name': species_info.get('scientificName'),
-										'species_key': species_key,
-										'iucn_category': iucn_cat,
-										'family': family_name,
-										'total_occurrences': occurrence_count
-									})
-				else:
-					print(f"  Error for {iucn_cat}: HTTP {response.status_code}")
-				
-				time.sleep(0.3)  # Rate limiting
-				
-			except requests.exceptions.RequestException as e:
-				print(f"  Request error for {iucn_cat}: {e}")
+		for (iucn_cat, species_key, occurrence_count), species_info in zip(facet_rows, species_infos):
+			if species_info:
+				threatened_species.append({
+					'scientific_name': species_info.get('scientificName'),
+					'species_key': species_key,
+					'iucn_category': iucn_cat,
+					'family': family_name,
+					'total_occurrences': occurrence_count
+				})
 		
 		print(f"  Total threatened species found: {len(threatened_species)}")
 		return threatened_species
 	
-	def collect_all_bee_data(self):
+	async def _species_with_occurrences(self, session: aiohttp.ClientSession, species_info: Dict, total: int):
+		"""
+		Fetch occurrence data for one threatened species, merge it into its species info
+		and record the result. A failed search isn't recorded, so a resumed run retries it.
+		"""
+		scientific_name = species_info['scientific_name']
+		iucn_cat = species_info['iucn_category']
+		
+		occurrence_data = await self.search_occurrences_by_species(
+			session,
+			scientific_name,
+			iucn_cat
+		)
+		# Searches finish in any order, so progress is the number done so far
+		self.stats['searched'] += 1
+		print(f"  [{self.stats['searched']}/{total}] {scientific_name} ({iucn_cat})")
+		if occurrence_data is None:
+			self.stats['failed'] += 1
+			return
+		
+		# Combine species info with occurrence data
+		self.record_result({
+			**species_info,
+			**occurrence_data
+		})
+	
+	async def collect_all_bee_data(self):
 		"""
 		Main function to collect bee occurrence data from GBIF.
 		"""
 		print("=" * 70)
 		print("GBIF BEE OCCURRENCE DATA COLLECTION")
 		print("=" * 70)
-		print("\nStep 1: Getting family taxon keys...")
-		
-		# First, get all family keys
-		for family in self.bee_families:
-			key = self.get_family_taxon_key(family)
-			if key:
-				print(f"  {family}: {key}")
-		
-		print("\nStep 2: Finding threatened species in each family...")
-		
-		# Get all threatened species using occurrence facets
-		all_threatened_species = []
-		for family in self.bee_families:
-			family_key = self.family_keys.get(family)
-			if family_key:
-				species_list = self.get_threatened_species_in_family(family_key, family)
-				all_threatened_species.extend(species_list)
-				time.sleep(1)
-		
-		print(f"\nStep 3: Getting occurrence data for {len(all_threatened_species)} threatened species...")
-		
-		# Get occurrence data for each species
-		for i, species_info in enumerate(all_threatened_species, 1):
-			scientific_name = species_info['scientific_name']
-			iucn_cat = species_info['iucn_category']
+		
+		connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS)
+		timeout = aiohttp.ClientTimeout(total=30)
+		headers = {'Accept-Encoding': 'gzip', 'User-Agent': 'wild_bees/1.0'}
+		cache = SQLiteBackend(
+			cache_name=CACHE_NAME,
+			expire_after=CACHE_EXPIRE_AFTER,
+			urls_expire_after=CACHE_URLS_EXPIRE_AFTER,
+			allowed_codes=(200,)
+		)
+		
+		trace_config = aiohttp.TraceConfig()
+		trace_config.on_request_start.append(self._wait_for_rate_limit)
+		
+		# One session for the whole run so every request reuses a keep-alive connection,
+		# and repeat runs are answered from the on-disk cache
+		async with CachedSession(cache=cache, connector=connector, timeout=timeout, headers=headers, trace_configs=[trace_config]) as session:
+			print("\nStep 1: Getting family taxon keys...")
 			
-			print(f"  [{i}/{len(all_threatened_species)}] {scientific_name} ({iucn_cat})...")
+			# First, get all family keys
+			keys = await asyncio.gather(*(self.get_family_taxon_key(session, family) for family in self.bee_families))
+			for family, key in zip(self.bee_families, keys):
+				if key:
+					print(f"  {family}: {key}")
 			
-			occurrence_data = self.search_occurrences_by_species(
-				scientific_name,
-				iucn_cat
-			)
+			print("\nStep 2: Finding threatened species in each family...")
 			
-			# Combine species info with occurrence data
-			result = {
-				**species_info,
-				**occurrence_data
-			}
+			# Get all threatened species using occurrence facets
+			all_threatened_species = []
+			for family in self.bee_families:
+				family_key = self.family_keys.get(family)
+				if family_key:
+					species_list = await self.get_threatened_species_in_family(session, family_key, family)
+					all_threatened_species.extend(species_list)
 			
-			self.results.append(result)
+			# Species recorded by an earlier, interrupted run are not fetched again
+			remaining = [s for s in all_threatened_species if (s['scientific_name'], s['iucn_category']) not in self.stream.collected]
 			
-			time.sleep(0.3)  # Rate limiting
+			print(f"\nStep 3: Getting occurrence data for {len(remaining)} threatened species...")
+			
+			# Get occurrence data for every species concurrently
+			total = len(remaining)
+			await asyncio.gather(*(
+				self._species_with_occurrences(session, species_info, total)
+				for species_info in remaining
+			))
 		
 		print(f"\n{'='*70}")
-		print(f"Total species processed: {len(self.results)}")
+		print(f"Total species processed: {self.stats['species']}")
+		if self.stats['failed']:
+			print(f"Occurrence searches failed for {self.stats['failed']} species; run again to retry them")
 		print(f"{'='*70}")
 		
-		return self.results
+		return self.stats['species']
 	
 	def save_results(self, filename: str = 'gbif_bees.json'):
-		"""Save results to a JSON file."""
-		output = {
+		"""
+		Save results to a JSON file.
+		Records are copied line by line from the results stream, which is removed afterwards.
+		"""
+		self.stream.save(filename, {
 			'collection_date': datetime.now().isoformat(),
-			'total_species': len(self.results),
-			'data_source': 'GBIF',
-			'species': self.results
-		}
-		
-		with open(filename, 'w', encoding='utf-8') as f:
-			json.dump(output, f, indent=2, ensure_ascii=False)
+			'total_species': self.stats['species'],
+			'data_source': 'GBIF'
+		})
 		
 		print(f"\n✓ Results saved to {filename}")
 	
@@ -269,48 +450,29 @@ class GBIFBeeData:
 		print("SUMMARY")
 		print("=" * 70)
 		
-		# Count by family
-		family_counts = {}
-		for species in self.results:
-			family = species.get('family', 'Unknown')
-			family_counts[family] = family_counts.get(family, 0) + 1
-		
-		print(f"\nTotal species found: {len(self.results)}")
+		print(f"\nTotal species found: {self.stats['species']}")
 		print("\nBy family:")
-		for family, count in sorted(family_counts.items()):
+		for family, count in sorted(self.family_counts.items()):
 			print(f"  {family}: {count}")
 		
-		# Count by IUCN category
-		iucn_counts = {}
-		for species in self.results:
-			cat = species.get('iucn_category', 'Unknown')
-			iucn_counts[cat] = iucn_counts.get(cat, 0) + 1
-		
 		print("\nBy IUCN Red List Category:")
-		for cat in ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']:
-			count = iucn_counts.get(cat, 0)
+		for cat in IUCN_CATEGORY_ORDER:
+			count = self.iucn_counts.get(cat, 0)
 			if count > 0:
 				print(f"  {cat}: {count}")
 		
-		# Count species with occurrence records
-		species_with_occurrences = [s for s in self.results if s.get('total_occurrences', 0) > 0]
-		print(f"\nSpecies with occurrence records: {len(species_with_occurrences)}")
-		
-		# Show total occurrences
-		total_occurrences = sum(s.get('total_occurrences', 0) for s in self.results)
-		print(f"Total occurrence records: {total_occurrences:,}")
+		print(f"\nSpecies with occurrence records: {self.stats['with_occurrences']}")
+		print(f"Total occurrence records: {self.stats['occurrences']:,}")
 		
 		# Show some examples
-		if species_with_occurrences:
+		if self.stats['with_occurrences']:
 			print(f"\nExample species with most occurrences (top 5):")
-			sorted_species = sorted(self.results, key=lambda x: x.get('total_occurrences', 0), reverse=True)
-			for i, species in enumerate(sorted_species[:5], 1):
-				print(f"\n  {i}. {species['scientific_name']}")
-				print(f"     Family: {species['family']}")
-				print(f"     IUCN: {species['iucn_category']}")
-				print(f"     Occurrences: {species['total_occurrences']:,}")
-				if species.get('recent_occurrences'):
-					latest = species['recent_occurrences'][0]
+			for i, (occurrences, _, name, family, iucn_cat, latest) in enumerate(sorted(self.top_species, reverse=True), 1):
+				print(f"\n  {i}. {name}")
+				print(f"     Family: {family}")
+				print(f"     IUCN: {iucn_cat}")
+				print(f"     Occurrences: {occurrences:,}")
+				if latest:
 					print(f"     Latest record: {latest['date']} in {latest['country']}")
 
 def main():
@@ -329,7 +491,7 @@ def main():
 	print()
 	
 	# Collect all data
-	collector.collect_all_bee_data()
+	asyncio.run(collector.collect_all_bee_data())
 	
 	# Print summary
 	collector.print_summary()
@@ -1,18 +1,88 @@
 #!/usr/bin/env python3
 """
 Script to collect endangered bee species data from IUCN Red List and iNaturalist APIs.
-Requires: requests library (pip install requests)
+Requires: httpx[http2], hishel, aiolimiter, orjson libraries (pip install 'httpx[http2]' 'hishel[httpx]>=1.0' aiolimiter orjson)
 """
 
-import requests
-import json
-import time
+import asyncio
+import contextlib
+import httpx
+from hishel import AsyncSqliteStorage, BaseFilter, FilterPolicy
+from hishel.httpx import AsyncCacheTransport
+from aiolimiter import AsyncLimiter
+import orjson
+import pathlib
+import sys
+from collections import Counter
 from typing import List, Dict, Optional
 from datetime import datetime
-import ipdb
+
+# Helpers shared by the collectors live at the top of the repository
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from api_helpers import ResultStream, retry_delay
+
+# iNaturalist accepts up to 30 comma-separated taxon IDs per request,
+# and returns at most 200 observations per page
+INAT_BATCH_SIZE = 30
+INAT_MAX_PER_PAGE = 200
+
+# On-disk response cache; observations change daily, taxa and IUCN assessments rarely do
+CACHE_PATH = 'inat_cache.db'
+CACHE_TTL = 86400 * 7
+OBSERVATIONS_CACHE_TTL = 3600
+
+# Transient statuses worth retrying, with exponential backoff between attempts
+# unless the server says how long to wait with Retry-After
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+# Species records are appended here as they are collected, so an interrupted
+# run keeps its progress; save_results folds the file into the final JSON
+RESULTS_STREAM = 'endangered_bees.ndjson'
+
+class SuccessOnlyFilter(BaseFilter):
+	"""
+	Response filter that only lets 200 responses into the cache, so an error left
+	over after the retries (a 429, a 5xx, a 401 from a bad token) isn't replayed.
+	"""
+	
+	def needs_body(self) -> bool:
+		return False
+	
+	def apply(self, item, body: Optional[bytes]) -> bool:
+		return item.status_code == 200
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+	"""
+	Transport that paces requests with a per-host token bucket and retries transient errors.
+	It sits underneath the cache transport, so cache hits are never throttled.
+	Hosts without a limiter aren't paced, only retried.
+	"""
+	
+	def __init__(self, transport: httpx.AsyncBaseTransport, limiters: Dict[str, AsyncLimiter]):
+		self.transport = transport
+		self.limiters = limiters
+	
+	async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+		limiter = self.limiters.get(request.url.host) or contextlib.nullcontext()
+		for attempt in range(MAX_RETRIES + 1):
+			async with limiter:
+				response = await self.transport.handle_async_request(request)
+			if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+				return response
+			await response.aclose()
+			await asyncio.sleep(retry_delay(response.headers, RETRY_BACKOFF * 2 ** attempt))
+	
+	async def aclose(self):
+		await self.transport.aclose()
+
+def batched(items: List, size: int) -> List[List]:
+	"""Split a list into consecutive chunks of at most `size` items."""
+	return [items[i:i + size] for i in range(0, len(items), size)]
 
 class BeeConservationData:
-	def __init__(self):
+	def __init__(self, debug: bool = False):
 		self.iucn_base_url = "https://apiv3.iucnredlist.org/api/v3"
 		self.inat_base_url = "https://api.inaturalist.org/v1"
 		
@@ -20,7 +90,7 @@ class BeeConservationData:
 		self.iucn_token = "YOUR_IUCN_API_TOKEN_HERE"
 		
 		# Conservation statuses we're interested in (IUCN format)
-		self.target_statuses = ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']
+		self.target_statuses = frozenset(('EX', 'EW', 'CR', 'EN', 'VU', 'NT'))
 		
 		# iNaturalist uses different format: lowercase with underscores
 		self.inat_status_map = {
@@ -32,10 +102,59 @@ class BeeConservationData:
 			'VU': 'VU',
 			'near threatened': 'NT'
 		}
+		# Same map keyed by normalized status name, so each taxon needs a single lookup
+		self.status_lookup = {k.lower().replace(' ', '_'): v for k, v in self.inat_status_map.items()}
+		
+		# Print every taxon's status as it's scanned
+		self.debug = debug
+		
+		# One HTTP/2 client multiplexes every request over a single connection per host.
+		# Requests that miss the on-disk cache are paced by each API's published quota.
+		limiters = {
+			'api.inaturalist.org': AsyncLimiter(60, 60),
+			'apiv3.iucnredlist.org': AsyncLimiter(2, 1)
+		}
+		http_transport = httpx.AsyncHTTPTransport(
+			http2=True,
+			limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+		)
+		self.client = httpx.AsyncClient(
+			transport=AsyncCacheTransport(
+				next_transport=RateLimitedTransport(http_transport, limiters),
+				storage=AsyncSqliteStorage(database_path=CACHE_PATH, default_ttl=CACHE_TTL),
+				# Cache every successful response, regardless of its cache headers. Observation
+				# searches go through the same transport, with a shorter hishel_ttl
+				policy=FilterPolicy(response_filters=[SuccessOnlyFilter()])
+			),
+			headers={'Accept-Encoding': 'gzip', 'User-Agent': 'wild_bees/1.0'},
+			timeout=30
+		)
+		
+		# Running totals for print_summary, so records don't have to be kept in memory
+		self.status_counts = Counter()
+		self.stats = Counter()
 		
-		self.results = []
+		# Pick up where an interrupted run left off
+		self.stream = ResultStream(RESULTS_STREAM, key=lambda s: s.get('scientific_name'))
+		self.stream.resume(self._update_stats)
+	
+	def _update_stats(self, species: Dict):
+		"""
+		Fold one species record into the running summary totals.
+		"""
+		self.status_counts[species.get('iucn_status', 'Unknown')] += 1
+		self.stats['species'] += 1
+		if species.get('observations_count', 0) > 0:
+			self.stats['with_observations'] += 1
+	
+	def record_result(self, species: Dict):
+		"""
+		Append one species record to the results stream and the running totals.
+		"""
+		self.stream.record(species)
+		self._update_stats(species)
 	
-	def search_iucn_bees(self) -> List[Dict]:
+	async def search_iucn_bees(self) -> List[Dict]:
 		"""
 		Search IUCN Red List for bee species with threatened status.
 		Note: IUCN uses 'Apoidea' superfamily, but we'll filter for actual bees (Anthophila).
@@ -60,10 +179,10 @@ class BeeConservationData:
 			# Get comprehensive species list endpoint
 			search_endpoint = f"{self.iucn_base_url}/speciesgroup/Hymenoptera/page/{page}"
 			
-			response = requests.get(search_endpoint, params=params, timeout=30)
+			response = await self.client.get(search_endpoint, params=params)
 			
 			if response.status_code == 200:
-				data = response.json()
+				data = orjson.loads(response.content)
 				
 				# Filter for bees and target conservation statuses
 				if 'result' in data:
@@ -83,101 +202,159 @@ class BeeConservationData:
 				print("Note: You need to add your IUCN API token to use this script.")
 				print("Get a free token at: https://apiv3.iucnredlist.org/api/v3/token")
 				
-		except requests.exceptions.RequestException as e:
+		except httpx.HTTPError as e:
 			print(f"Error querying IUCN: {e}")
 		
 		return all_bee_species
 	
-	def get_iucn_species_details(self, taxonid: int) -> Optional[Dict]:
+	async def get_iucn_species_details(self, taxonid: int) -> Optional[Dict]:
 		"""Get detailed information for a specific species from IUCN."""
 		endpoint = f"{self.iucn_base_url}/species/id/{taxonid}"
 		params = {'token': self.iucn_token}
 		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
+			response = await self.client.get(endpoint, params=params)
 			if response.status_code == 200:
-				data = response.json()
+				data = orjson.loads(response.content)
 				return data.get('result', [{}])[0]
-			time.sleep(0.5)  # Rate limiting
-		except requests.exceptions.RequestException as e:
+		except httpx.HTTPError as e:
 			print(f"Error getting species details: {e}")
 		
 		return None
 	
-	def search_inat_species(self, scientific_name: str) -> Optional[Dict]:
+	async def _lookup_taxon_id(self, scientific_name: str) -> Optional[int]:
 		"""
-		Search iNaturalist for species observations and data.
+		Find the iNaturalist taxon ID for a species by its scientific name.
+		Returns None if no species matches; raises httpx.HTTPError if the lookup fails.
 		"""
-		# First, get the taxon ID
 		taxon_endpoint = f"{self.inat_base_url}/taxa"
 		params = {
 			'q': scientific_name,
 			'rank': 'species',
 			'is_active': 'true'
 		}
-		#ipdb.set_trace()
+		response = await self.client.get(taxon_endpoint, params=params)
+		response.raise_for_status()
+		results = orjson.loads(response.content).get('results', [])
+		
+		return results[0].get('id') if results else None
+	
+	async def search_inat_species(self, scientific_name: str, taxon_id: Optional[int] = None) -> Optional[Dict]:
+		"""
+		Search iNaturalist for species observations and data.
+		Pass taxon_id when it is already known to skip the /taxa name lookup.
+		Returns the most recent observation, {} if there is none, or None if a lookup failed.
+		"""
+		# First, get the taxon ID
+		if taxon_id is None:
+			try:
+				taxon_id = await self._lookup_taxon_id(scientific_name)
+			except httpx.HTTPError as e:
+				print(f"Error querying iNaturalist for {scientific_name}: {e}")
+				return None
+			if taxon_id is None:
+				return {}
+		
+		# Get recent observations
+		obs_data = await self.get_inat_observations(taxon_id, scientific_name)
+		if obs_data is None:
+			return None
+		
+		return (obs_data[0] if obs_data else {}) #{
+			#'inat_taxon_id': taxon_id,
+			#'observations_count': taxon.get('observations_count', 0),
+			#'wikipedia_summary': taxon.get('wikipedia_summary'),
+			#'recent_observations': obs_data
+		#}
+	
+	async def get_inat_observations(self, taxon_id: int, scientific_name: str, limit: int = 1) -> Optional[List[Dict]]:
+		"""
+		Get recent observations for a species from iNaturalist.
+		Returns None if the request failed.
+		"""
+		obs_endpoint = f"{self.inat_base_url}/observations"
+		params = {
+			'taxon_id': taxon_id,
+			'order': 'desc',
+			'order_by': 'observed_on',
+			'per_page': limit,
+			'quality_grade': 'research'  # Only verified observations
+		}
+		
 		try:
-			response = requests.get(taxon_endpoint, params=params, timeout=30)
+			response = await self.client.get(obs_endpoint, params=params, extensions={'hishel_ttl': OBSERVATIONS_CACHE_TTL})
 			if response.status_code == 200:
-				data = response.json()
-				results = data.get('results', [])
+				data = orjson.loads(response.content)
+				observations = []
 				
-				if results:
-					taxon = results[0]
-					taxon_id = taxon.get('id')
-					
-					# Get recent observations
-					obs_data = self.get_inat_observations(taxon_id, scientific_name)
-					
-					return (obs_data[0] if obs_data else {}) #{
-						#'inat_taxon_id': taxon_id,
-						#'observations_count': taxon.get('observations_count', 0),
-						#'wikipedia_summary': taxon.get('wikipedia_summary'),
-						#'recent_observations': obs_data
-					#}
-			
-			time.sleep(0.3)  # Rate limiting for iNaturalist
+				for obs in data.get('results', []):
+					observations.append(self.format_inat_observation(obs))
+				return observations
 			
-		except requests.exceptions.RequestException as e:
-			print(f"Error querying iNaturalist for {scientific_name}: {e}")
+			print(f"Error getting observations for {scientific_name}: HTTP {response.status_code}")
+		except httpx.HTTPError as e:
+			print(f"Error getting observations for {scientific_name}: {e}")
 		
 		return None
 	
-	def get_inat_observations(self, taxon_id: int, scientific_name: str, limit: int = 1) -> List[Dict]:
-		"""Get recent observations for a species from iNaturalist."""
+	def format_inat_observation(self, obs: Dict) -> Dict:
+		"""Pick the fields we keep from an iNaturalist observation record."""
+		# 'location' is a "lat,lon" string; parse it once, into numbers
+		loc = obs.get('location')
+		lat, lon = (float(x) for x in loc.split(',')) if loc else (None, None)
+		
+		return {
+			'date': obs.get('observed_on'),
+			'location': obs.get('place_guess'),
+			'latitude': lat,
+			'longitude': lon,
+			'observer': obs.get('user', {}).get('login'),
+			'url': obs.get('uri')
+		}
+	
+	async def get_inat_observations_batch(self, taxon_ids: List[int]) -> Optional[Dict[int, Dict]]:
+		"""
+		Get the most recent observation for up to INAT_BATCH_SIZE species in one request.
+		Returns {taxon_id: observation}. Observations are grouped client-side, so a
+		species only shows up if it has one within the first page of results; when
+		that page holds every matching observation, species without any map to {}.
+		Returns None if the request failed.
+		"""
 		obs_endpoint = f"{self.inat_base_url}/observations"
 		params = {
-			'taxon_id': taxon_id,
+			'taxon_id': ','.join(map(str, taxon_ids)),
 			'order': 'desc',
 			'order_by': 'observed_on',
-			'per_page': limit,
+			'per_page': INAT_MAX_PER_PAGE,
 			'quality_grade': 'research'  # Only verified observations
 		}
 		
+		latest = {}
 		try:
-			response = requests.get(obs_endpoint, params=params, timeout=30)
-			#ipdb.set_trace()
+			response = await self.client.get(obs_endpoint, params=params, extensions={'hishel_ttl': OBSERVATIONS_CACHE_TTL})
 			if response.status_code == 200:
-				data = response.json()
-				observations = []
+				data = orjson.loads(response.content)
+				wanted = set(taxon_ids)
 				
 				for obs in data.get('results', []):
-					observations.append({
-						'date': obs.get('observed_on'),
-						'location': obs.get('place_guess'),
-						'latitude': obs.get('location', '').split(',')[0] if obs.get('location') else None,
-						'longitude': obs.get('location', '').split(',')[1] if obs.get('location') else None,
-						'observer': obs.get('user', {}).get('login'),
-						'url': obs.get('uri')
-					})
-				return observations
+					# Observations may be identified to a subspecies, so match on ancestry too
+					taxon = obs.get('taxon') or {}
+					for taxon_id in wanted.intersection([taxon.get('id'), *(taxon.get('ancestor_ids') or [])]):
+						latest.setdefault(taxon_id, self.format_inat_observation(obs))
 				
-		except requests.exceptions.RequestException as e:
-			print(f"Error getting observations: {e}")
+				# A complete result set means the remaining species have no observations
+				if data.get('total_results', 0) <= INAT_MAX_PER_PAGE:
+					for taxon_id in wanted.difference(latest):
+						latest[taxon_id] = {}
+				return latest
+			
+			print(f"Error getting batched observations: HTTP {response.status_code}")
+		except httpx.HTTPError as e:
+			print(f"Error getting batched observations: {e}")
 		
-		return []
+		return None
 	
-	def get_all_threatened_bees_inat(self) -> List[Dict]:
+	async def get_all_threatened_bees_inat(self) -> List[Dict]:
 		"""
 		Get all bee species with conservation status from iNaturalist.
 		iNaturalist tracks IUCN conservation statuses in their taxonomy.
@@ -209,10 +386,9 @@ class BeeConservationData:
 			}
 			
 			try:
-				response = requests.get(taxon_endpoint, params=params, timeout=30)
-				#ipdb.set_trace()
+				response = await self.client.get(taxon_endpoint, params=params)
 				if response.status_code == 200:
-					data = response.json()
+					data = orjson.loads(response.content)
 					results = data.get('results', [])
 					
 					if results:
@@ -227,15 +403,13 @@ class BeeConservationData:
 							'is_active': 'true'
 						}
 						
-						species_response = requests.get(species_endpoint, params=species_params, timeout=30)
+						species_response = await self.client.get(species_endpoint, params=species_params)
 						if species_response.status_code == 200:
-							#ipdb.set_trace()
 							
-							species_data = species_response.json()
+							species_data = orjson.loads(species_response.content)
 							
 							for taxon in species_data.get('results', []):
 								#per_species_request = requests.get(species_endpoint, params={'taxon_id': 121519, 'rank': 'species', 'is_active': 'true'}, timeout=30)
-								#ipdb.set_trace()
                 # Check if species has conservation status
 								# iNaturalist stores this in conservation_statuses array
 								conservation_statuses = taxon.get('conservation_statuses', [])
@@ -247,16 +421,11 @@ class BeeConservationData:
 										conservation_statuses = [conservation_status]
 								
 								for status_obj in conservation_statuses:
-									if isinstance(status_obj, dict):
-										status_code = status_obj.get('status_name', '')
-									else:
-										# Sometimes it's just a string
-										status_code = status_obj
-									
+									# Sometimes it's just a string
+									status_code = status_obj.get('status_name', '') if isinstance(status_obj, dict) else status_obj
 									# Map iNat format to IUCN abbreviations
-									iucn_code = self.inat_status_map.get(status_code)
-									# Filter for our target statuses
-									if isinstance(status_code, str):
+									iucn_code = self.status_lookup.get((status_code or '').lower().replace(' ', '_'))
+									if self.debug:
 										print(f"{taxon['name']} is {status_code}")
 									
 									if status_code:
@@ -276,57 +445,55 @@ class BeeConservationData:
 										all_bees.append(result)
 										break  # Only add once per species
 				
-				time.sleep(0.5)  # Rate limiting
-				
-			except requests.exceptions.RequestException as e:
+			except httpx.HTTPError as e:
 				print(f"Error querying {family}: {e}")
 		
 		return all_bees
 	
-		"""Main function to collect all bee conservation data."""
-		print("=" * 60)
-		print("ENDANGERED BEE SPECIES DATA COLLECTION")
-		print("=" * 60)
-		print()
+	async def collect_observations(self, batch: List[Dict]):
+		"""
+		Add the most recent observation to a batch of species and record each one.
+		One request covers the whole batch; species it doesn't cover are looked up on their own.
+		Species whose lookup failed aren't recorded, so a resumed run retries them.
+		"""
+		taxon_ids = [s['inat_taxon_id'] for s in batch if s.get('inat_taxon_id')]
+		latest = await self.get_inat_observations_batch(taxon_ids) if taxon_ids else {}
 		
-		# Step 1: Get IUCN bee species
-		iucn_species = self.search_iucn_bees()
-		print(f"\nFound {len(iucn_species)} bee species with conservation status on IUCN")
-		print()
+		# None marks a species whose lookup failed. If the batched request failed,
+		# its species are left for the next run rather than looked up one by one
+		if latest is None:
+			observations = [None] * len(batch)
+			uncovered = [i for i, s in enumerate(batch) if not s.get('inat_taxon_id')]
+		else:
+			observations = [latest.get(s.get('inat_taxon_id')) for s in batch]
+			uncovered = [i for i, s in enumerate(batch) if s.get('inat_taxon_id') not in latest]
 		
-		# Step 2: Enrich each species with additional data
-		for i, species in enumerate(iucn_species, 1):
-			print(f"Processing {i}/{len(iucn_species)}: {species['scientific_name']}...")
-			
-			# Get detailed IUCN info
-			if species.get('taxonid'):
-				iucn_details = self.get_iucn_species_details(species['taxonid'])
-				if iucn_details:
-					species['population_trend'] = iucn_details.get('population_trend')
-					species['habitat'] = iucn_details.get('habitat')
-			
-			# Get iNaturalist data
-			inat_data = self.search_inat_species(species['scientific_name'])
+		for i, inat_data in zip(uncovered, await asyncio.gather(*(
+			self.search_inat_species(batch[i]['scientific_name'], taxon_id=batch[i].get('inat_taxon_id')) for i in uncovered
+		))):
+			observations[i] = inat_data
+		
+		recorded = 0
+		for species, inat_data in zip(batch, observations):
+			if inat_data is None:
+				self.stats['failed'] += 1
+				continue
 			if inat_data:
-				species['inat_data'] = inat_data
-			
-			self.results.append(species)
-			
-			# Rate limiting
-			time.sleep(1)
+				species['most_recent_observation'] = inat_data
+			self.record_result(species)
+			recorded += 1
 		
-		return self.results
+		print(f"Recorded {recorded} species ({self.stats['species']} so far)")
 	
 	def save_results(self, filename: str = 'endangered_bees.json'):
-		"""Save results to a JSON file."""
-		output = {
+		"""
+		Save results to a JSON file.
+		Records are copied line by line from the results stream, which is removed afterwards.
+		"""
+		self.stream.save(filename, {
 			'collection_date': datetime.now().isoformat(),
-			'total_species': len(self.results),
-			'species': self.results
-		}
-		
-		with open(filename, 'w', encoding='utf-8') as f:
-			json.dump(output, f, indent=2, ensure_ascii=False)
+			'total_species': self.stats['species']
+		})
 		
 		print(f"\n✓ Results saved to {filename}")
 	
@@ -336,48 +503,46 @@ class BeeConservationData:
 		print("SUMMARY")
 		print("=" * 60)
 		
-		status_counts = {}
-		for species in self.results:
-			status = species.get('iucn_status', 'Unknown')
-			status_counts[status] = status_counts.get(status, 0) + 1
-		
-		print(f"\nTotal species found: {len(self.results)}")
+		print(f"\nTotal species found: {self.stats['species']}")
 		print("\nBy conservation status:")
 		for status in ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']:
-			count = status_counts.get(status, 0)
+			count = self.status_counts.get(status, 0)
 			if count > 0:
 				print(f"  {status}: {count}")
 		
 		# Show species with recent iNaturalist observations
-		with_obs = [s for s in self.results if s.get('inat_data', {}).get('observations_count', 0) > 0]
-		print(f"\nSpecies with iNaturalist observations: {len(with_obs)}")
+		print(f"\nSpecies with iNaturalist observations: {self.stats['with_observations']}")
 
-def main():
+async def main():
 	"""Main execution function."""
 	collector = BeeConservationData()
 	
-	# For now, use iNaturalist only (no IUCN token required)
-	print("=" * 60)
-	print("ENDANGERED BEE SPECIES DATA COLLECTION (iNaturalist)")
-	print("=" * 60)
-	print()
-	
-	# Get all bee species from iNaturalist with conservation status
-	bee_species = collector.get_all_threatened_bees_inat()
-	
-	print(f"\nFound {len(bee_species)} bee species with conservation status")
-	print()
-	
-	# Collect detailed data for each species
-	for i, species in enumerate(bee_species, 1):
-		print(f"Processing {i}/{len(bee_species)}: {species['scientific_name']}...")
+	try:
+		# For now, use iNaturalist only (no IUCN token required)
+		print("=" * 60)
+		print("ENDANGERED BEE SPECIES DATA COLLECTION (iNaturalist)")
+		print("=" * 60)
+		print()
+		
+		# Get all bee species from iNaturalist with conservation status
+		bee_species = await collector.get_all_threatened_bees_inat()
+		
+		print(f"\nFound {len(bee_species)} bee species with conservation status")
+		print()
 		
-		inat_data = collector.search_inat_species(species['scientific_name'])
-		if inat_data:
-			species['most_recent_observation'] = inat_data
+		# Species recorded by an earlier, interrupted run are not fetched again
+		bee_species = [s for s in bee_species if s['scientific_name'] not in collector.stream.collected]
 		
-		collector.results.append(species)
-		time.sleep(0.5)  # Rate limiting
+		# Fetch the most recent observations for INAT_BATCH_SIZE species per request,
+		# all batches multiplexed over the same connection. Each batch is recorded as
+		# soon as it completes, so an interrupted run picks up from there
+		await asyncio.gather(*(
+			collector.collect_observations(batch) for batch in batched(bee_species, INAT_BATCH_SIZE)
+		))
+		if collector.stats['failed']:
+			print(f"\nObservation lookups failed for {collector.stats['failed']} species; run again to retry them")
+	finally:
+		await collector.client.aclose()
 	
 	# Save and display results
 	collector.save_results()
@@ -390,4 +555,4 @@ def main():
 	print("3. Add GBIF queries for more occurrence data")
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	asyncio.run(main())
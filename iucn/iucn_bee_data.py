@@ -1,16 +1,66 @@
 #!/usr/bin/env python3
 """
 Script to collect bee conservation data from IUCN Red List API.
-Requires: requests library (pip install requests)
+Requires: aiohttp, aiohttp-client-cache, aiolimiter, orjson libraries (pip install aiohttp aiohttp-client-cache[sqlite] aiolimiter orjson)
 
 Get your free API token at: https://api.iucnredlist.org/users/sign_up
+and pass it with --token or in the IUCN_API_TOKEN environment variable.
 """
 
-import requests
-import json
-import time
+import aiohttp
+import argparse
+import asyncio
+import logging
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from aiolimiter import AsyncLimiter
+import orjson
+import os
 from typing import List, Dict, Optional
+from collections import Counter
 from datetime import datetime
+import pathlib
+import shelve
+import sys
+from urllib.parse import quote, urlencode
+
+# Helpers shared by the collectors live at the top of the repository
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from api_helpers import (
+	conditional_headers, load_results, refresh_cached_response, remember_validators, retry_delay, start_logging
+)
+
+# Cap on IUCN requests in flight at once, and on species being looked up at once
+MAX_CONCURRENT_REQUESTS = 8
+MAX_CONCURRENT_SPECIES = 16
+
+# IUCN asks for a 2-second gap between calls
+IUCN_REQUESTS_PER_PERIOD = 1
+IUCN_RATE_PERIOD = 2
+
+# Transient statuses worth retrying, waiting 1, 2, 4, 8 seconds between attempts
+# unless the server says how long to wait with Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 5
+
+# Species records are written here, one JSON object per line, as each family
+# completes; the collection metadata goes to a small file alongside
+RESULTS_PATH = 'iucn_bees.jsonl'
+META_PATH = 'iucn_bees.meta.json'
+
+# Species details the assessment endpoint is asked to embed, so a species needs
+# one request instead of four where the API supports it
+INCLUDED_DETAILS = ('threats', 'habitats', 'conservation_measures')
+
+# On-disk response cache. Failed lookups (404) are cached too, and responses
+# carrying their own Cache-Control/Expires headers follow those instead
+CACHE_NAME = 'iucn_cache'
+CACHE_EXPIRE_AFTER = 86400 * 7
+
+# ETag/Last-Modified validators per URL, kept across cache expiry and --refresh
+# so unchanged resources come back as an empty 304 instead of a full download
+VALIDATORS_NAME = 'iucn_validators'
+
+logger = logging.getLogger(__name__)
 
 class IUCNBeeData:
 	def __init__(self, api_token: str):
@@ -31,11 +81,65 @@ class IUCNBeeData:
 		]
 		
 		# IUCN Red List categories we care about
-		self.target_categories = ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']
+		self.target_categories = frozenset(('EX', 'EW', 'CR', 'EN', 'VU', 'NT'))
+		
+		# Shared by every request, so concurrent species lookups don't flood the API
+		self.request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+		self.species_slots = asyncio.Semaphore(MAX_CONCURRENT_SPECIES)
+		
+		# Query parameters shared by every species request, built once
+		self._params = {'token': self.api_token}
+		self._include_params = {**self._params, 'include': ','.join(INCLUDED_DETAILS)}
+		
+		# Whether assessments come back with INCLUDED_DETAILS embedded; None until the first one arrives
+		self.include_supported = None
+		
+		# Token bucket pacing every request to IUCN's published rate
+		self.iucn_limiter = AsyncLimiter(IUCN_REQUESTS_PER_PERIOD, IUCN_RATE_PERIOD)
 		
-		self.results = []
+		self.results_path = RESULTS_PATH
+		self.total_species = 0
+		self.validators = {}
 	
-	def get_species_by_taxon(self, taxon_name: str) -> List[Dict]:
+	async def _fetch_json(self, session: aiohttp.ClientSession, url: str, params: Optional[Dict] = None) -> Dict:
+		"""
+		GET a URL and decode its JSON body.
+		Rate limiting happens in _wait_for_rate_limit, as requests leave the cache.
+		Transient errors (RETRY_STATUSES) are retried after Retry-After or an exponential backoff.
+		A GET seen on an earlier run is revalidated; a 304 is answered from the stored body,
+		which also goes back into the response cache.
+		Raises aiohttp.ClientResponseError on a non-200 response.
+		"""
+		# The token is left out of the validator key, like the cache keys
+		key = url
+		if params:
+			key += '?' + urlencode(sorted((k, v) for k, v in params.items() if k != 'token'))
+		stored = self.validators.get(key)
+		
+		for attempt in range(MAX_ATTEMPTS):
+			async with self.request_slots:
+				async with session.get(url, params=params, headers=conditional_headers(stored)) as response:
+					if response.status == 304 and stored:
+						await refresh_cached_response(session, url, params, response, stored['body'])
+						return orjson.loads(stored['body'])
+					if response.status not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+						response.raise_for_status()
+						# Read the raw body so cached and live responses both decode with orjson
+						body = await response.read()
+						if not response.from_cache:
+							remember_validators(self.validators, key, response, body)
+						return orjson.loads(body)
+					delay = retry_delay(response.headers, 2 ** attempt)
+			await asyncio.sleep(delay)
+	
+	async def _wait_for_rate_limit(self, session, trace_config_ctx, params):
+		"""
+		Request-start trace hook: take a token from the rate limiter.
+		Cache hits never start a real request, so they aren't rate limited.
+		"""
+		await self.iucn_limiter.acquire()
+	
+	async def get_species_by_taxon(self, session: aiohttp.ClientSession, taxon_name: str) -> List[Dict]:
 		"""
 		Get all species assessments for a given taxon (e.g., family).
 		"""
@@ -46,145 +150,194 @@ class IUCNBeeData:
 		}
 		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				return data.get('results', [])
-			else:
-				print(f"  Error: HTTP {response.status_code}")
-				if response.status_code == 401:
-					print("  Authentication failed. Check your API token.")
-				elif response.status_code == 404:
-					print(f"  Taxon '{taxon_name}' not found.")
-		except requests.exceptions.RequestException as e:
-			print(f"  Request error: {e}")
+			data = await self._fetch_json(session, endpoint, params)
+			return data.get('results', [])
+		except aiohttp.ClientResponseError as e:
+			logger.error(f"  Error: HTTP {e.status}")
+			if e.status == 401:
+				logger.error("  Authentication failed. Check your API token.")
+			elif e.status == 404:
+				logger.error(f"  Taxon '{taxon_name}' not found.")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.error(f"  Request error: {e!r}")
 		
 		return []
 	
-	def get_species_assessment(self, scientific_name: str) -> Optional[Dict]:
+	async def get_species_assessment(self, session: aiohttp.ClientSession, species_url: str) -> Optional[Dict]:
 		"""
-		Get detailed assessment for a specific species by scientific name.
+		Get detailed assessment for a specific species from its /species/{name} URL.
 		"""
-		# URL encode the species name
-		encoded_name = scientific_name.replace(' ', '%20')
-		endpoint = f"{self.base_url}/species/{encoded_name}"
-		params = {'token': self.api_token}
-		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				return data.get('result', {})
-			elif response.status_code == 404:
-				# Species not found - might not have IUCN assessment
-				return None
-		except requests.exceptions.RequestException as e:
-			print(f"    Error getting assessment: {e}")
+			data = await self._fetch_json(session, species_url, self._params)
+			return data.get('result', {})
+		except aiohttp.ClientResponseError as e:
+			# A 404 means the species has no IUCN assessment
+			if e.status != 404:
+				logger.error(f"    Error getting assessment: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.error(f"    Error getting assessment: {e!r}")
 		
 		return None
 	
-	def get_species_threats(self, scientific_name: str) -> List[Dict]:
+	async def get_species_threats(self, session: aiohttp.ClientSession, url: str) -> List[Dict]:
 		"""
-		Get threat information for a species.
+		Get threat information for a species from its /species/{name}/threats URL.
 		"""
-		encoded_name = scientific_name.replace(' ', '%20')
-		endpoint = f"{self.base_url}/species/{encoded_name}/threats"
-		params = {'token': self.api_token}
-		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				return data.get('result', [])
-		except requests.exceptions.RequestException:
+			data = await self._fetch_json(session, url, self._params)
+			return data.get('result', [])
+		except (aiohttp.ClientError, asyncio.TimeoutError):
 			pass
 		
 		return []
 	
-	def get_species_habitats(self, scientific_name: str) -> List[Dict]:
+	async def get_species_habitats(self, session: aiohttp.ClientSession, url: str) -> List[Dict]:
 		"""
-		Get habitat information for a species.
+		Get habitat information for a species from its /species/{name}/habitats URL.
 		"""
-		encoded_name = scientific_name.replace(' ', '%20')
-		endpoint = f"{self.base_url}/species/{encoded_name}/habitats"
-		params = {'token': self.api_token}
-		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				return data.get('result', [])
-		except requests.exceptions.RequestException:
+			data = await self._fetch_json(session, url, self._params)
+			return data.get('result', [])
+		except (aiohttp.ClientError, asyncio.TimeoutError):
 			pass
 		
 		return []
 	
-	def get_species_conservation_measures(self, scientific_name: str) -> List[Dict]:
+	async def get_species_conservation_measures(self, session: aiohttp.ClientSession, url: str) -> List[Dict]:
 		"""
-		Get conservation measures for a species.
+		Get conservation measures for a species from its /species/{name}/conservation_measures URL.
 		"""
-		encoded_name = scientific_name.replace(' ', '%20')
-		endpoint = f"{self.base_url}/species/{encoded_name}/conservation_measures"
-		params = {'token': self.api_token}
-		
 		try:
-			response = requests.get(endpoint, params=params, timeout=30)
-			if response.status_code == 200:
-				data = response.json()
-				return data.get('result', [])
-		except requests.exceptions.RequestException:
+			data = await self._fetch_json(session, url, self._params)
+			return data.get('result', [])
+		except (aiohttp.ClientError, asyncio.TimeoutError):
 			pass
 		
 		return []
 	
-	def search_bees_in_family(self, family_name: str) -> List[Dict]:
+	async def _species_bundle(self, session: aiohttp.ClientSession, scientific_name: str, category: str, family_name: str) -> Optional[Dict]:
+		"""
+		Get the assessment and its details for one threatened species, all at once.
+		Returns None if the species has no assessment.
+		"""
+		species_url = f"{self.base_url}/species/{quote(scientific_name)}"
+		
+		async with self.species_slots:
+			assessment = None
+			if self.include_supported is not False:
+				# Ask for everything in one request, and fall back to the detail endpoints
+				# if the API doesn't embed them or won't take the include parameter
+				try:
+					data = await self._fetch_json(session, species_url, self._include_params)
+					assessment = data.get('result', {})
+				except aiohttp.ClientResponseError as e:
+					# A 404 means the species has no IUCN assessment
+					if e.status == 404:
+						return None
+					logger.warning(f"    Combined assessment request failed: HTTP {e.status}; fetching details separately")
+					# A 4xx is the API rejecting the include parameter, so stop asking for it
+					if e.status < 500:
+						self.include_supported = False
+				except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+					logger.warning(f"    Combined assessment request failed: {e!r}; fetching details separately")
+			
+			if assessment is None:
+				assessment, threats, habitats, conservation_measures = await asyncio.gather(
+					self.get_species_assessment(session, species_url),
+					self.get_species_threats(session, species_url + '/threats'),
+					self.get_species_habitats(session, species_url + '/habitats'),
+					self.get_species_conservation_measures(session, species_url + '/conservation_measures')
+				)
+			elif assessment:
+				embedded = all(key in assessment for key in INCLUDED_DETAILS)
+				if self.include_supported is None:
+					self.include_supported = embedded
+				
+				if embedded:
+					threats, habitats, conservation_measures = (assessment.pop(key) for key in INCLUDED_DETAILS)
+				else:
+					threats, habitats, conservation_measures = await asyncio.gather(
+						self.get_species_threats(session, species_url + '/threats'),
+						self.get_species_habitats(session, species_url + '/habitats'),
+						self.get_species_conservation_measures(session, species_url + '/conservation_measures')
+					)
+		
+		if not assessment:
+			return None
+		
+		return {
+			'scientific_name': scientific_name,
+			'family': family_name,
+			'iucn_category': category,
+			'assessment': assessment,
+			'threats': threats,
+			'habitats': habitats,
+			'conservation_measures': conservation_measures
+		}
+	
+	async def search_bees_in_family(self, session: aiohttp.ClientSession, family_name: str) -> List[Dict]:
 		"""
 		Search for threatened bee species in a given family.
 		"""
-		print(f"\nSearching IUCN for {family_name}...")
+		logger.info(f"\nSearching IUCN for {family_name}...")
 		
 		# Get all species in the family
-		species_list = self.get_species_by_taxon(family_name)
-		
-		threatened_species = []
+		species_list = await self.get_species_by_taxon(session, family_name)
 		
+		# Only process threatened species
+		threatened = []
 		for species_info in species_list:
 			scientific_name = species_info.get('scientific_name', '')
 			category = species_info.get('category', '')
 			
-			# Only process threatened species
 			if category in self.target_categories:
-				print(f"  Found: {scientific_name} ({category})")
-				
-				# Get full assessment details
-				assessment = self.get_species_assessment(scientific_name)
-				
-				if assessment:
-					# Get additional details
-					threats = self.get_species_threats(scientific_name)
-					habitats = self.get_species_habitats(scientific_name)
-					conservation_measures = self.get_species_conservation_measures(scientific_name)
-					
-					result = {
-						'scientific_name': scientific_name,
-						'family': family_name,
-						'iucn_category': category,
-						'assessment': assessment,
-						'threats': threats,
-						'habitats': habitats,
-						'conservation_measures': conservation_measures
-					}
-					
-					threatened_species.append(result)
-				
-				time.sleep(2)  # IUCN recommends 2-second delay between calls
+				logger.info(f"  Found: {scientific_name} ({category})")
+				threatened.append((scientific_name, category))
+		
+		# Look up every threatened species concurrently
+		bundles = await asyncio.gather(*(
+			self._species_bundle(session, scientific_name, category, family_name)
+			for scientific_name, category in threatened
+		))
+		threatened_species = [bundle for bundle in bundles if bundle]
 		
-		print(f"  Total threatened species: {len(threatened_species)}")
+		logger.info(f"  Total threatened species: {len(threatened_species)}")
 		return threatened_species
 	
-	def collect_all_bee_data(self):
+	async def _collect_async(self, refresh: bool = False):
+		"""
+		Search every bee family over one shared, cached HTTP session.
+		With refresh, the response cache is cleared first.
+		"""
+		# Pooled keep-alive connections, so only the first request pays for the TLS handshake
+		connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=MAX_CONCURRENT_REQUESTS, keepalive_timeout=60)
+		timeout = aiohttp.ClientTimeout(total=30)
+		headers = {'Accept-Encoding': 'gzip', 'User-Agent': 'wild_bees/1.0'}
+		cache = SQLiteBackend(
+			cache_name=CACHE_NAME,
+			expire_after=CACHE_EXPIRE_AFTER,
+			allowed_codes=(200, 404),
+			ignored_params=['token'],  # Keeps the API token out of the cache keys
+			cache_control=True
+		)
+		
+		trace_config = aiohttp.TraceConfig()
+		trace_config.on_request_start.append(self._wait_for_rate_limit)
+		
+		async with CachedSession(cache=cache, connector=connector, timeout=timeout, headers=headers, trace_configs=[trace_config]) as session:
+			if refresh:
+				await session.cache.clear()
+			
+			# All families are searched at once; the shared limiter and request slots
+			# keep the combined traffic within IUCN's limits
+			searches = [self.search_bees_in_family(session, family) for family in self.bee_families]
+			for family_search in asyncio.as_completed(searches):
+				self.record_results(await family_search)
+	
+	def collect_all_bee_data(self, refresh: bool = False):
 		"""
 		Main function to collect bee conservation data from IUCN.
+		Pass refresh=True to ignore previously cached responses.
 		"""
 		print("=" * 70)
 		print("IUCN RED LIST BEE CONSERVATION DATA COLLECTION")
@@ -199,93 +352,106 @@ class IUCNBeeData:
 			print("3. Replace 'YOUR_IUCN_API_TOKEN_HERE' in the script")
 			print("\nOr pass the token when creating the object:")
 			print("   collector = IUCNBeeData(api_token='your_token_here')")
-			return []
+			return 0
 		
-		for family in self.bee_families:
-			family_species = self.search_bees_in_family(family)
-			self.results.extend(family_species)
-			time.sleep(2)
+		with open(self.results_path, 'wb') as self._out, shelve.open(VALIDATORS_NAME) as self.validators:
+			asyncio.run(self._collect_async(refresh))
 		
-		print(f"\n{'='*70}")
-		print(f"Total threatened bee species found: {len(self.results)}")
-		print(f"{'='*70}")
+		logger.info(f"\n{'='*70}")
+		logger.info(f"Total threatened bee species found: {self.total_species}")
+		logger.info(f"{'='*70}")
 		
-		return self.results
+		return self.total_species
 	
-	def save_results(self, filename: str = 'iucn_bees.json'):
-		"""Save results to a JSON file."""
+	def record_results(self, species_list: List[Dict]):
+		"""
+		Append a family's species records to the results file in a single write.
+		"""
+		if not species_list:
+			return
+		self._out.write(b''.join(orjson.dumps(species, option=orjson.OPT_NON_STR_KEYS) + b'\n' for species in species_list))
+		self.total_species += len(species_list)
+	
+	def save_results(self, filename: str = META_PATH):
+		"""
+		Save the collection metadata to a JSON file.
+		The species records themselves are already in the results file.
+		"""
 		output = {
 			'collection_date': datetime.now().isoformat(),
-			'total_species': len(self.results),
+			'total_species': self.total_species,
 			'data_source': 'IUCN Red List',
 			'api_version': 'v4',
-			'species': self.results
+			'species_file': self.results_path
 		}
 		
-		with open(filename, 'w', encoding='utf-8') as f:
-			json.dump(output, f, indent=2, ensure_ascii=False)
+		with open(filename, 'wb') as f:
+			f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 		
 		print(f"\n✓ Results saved to {filename}")
 	
 	def print_summary(self):
 		"""Print a summary of collected data."""
-		if not self.results:
+		if not self.total_species:
 			return
 		
-		print("\n" + "=" * 70)
-		print("SUMMARY")
-		print("=" * 70)
-		
-		# Count by family
-		family_counts = {}
-		for species in self.results:
-			family = species.get('family', 'Unknown')
-			family_counts[family] = family_counts.get(family, 0) + 1
-		
-		print(f"\nTotal species found: {len(self.results)}")
-		print("\nBy family:")
-		for family, count in sorted(family_counts.items()):
-			print(f"  {family}: {count}")
-		
-		# Count by IUCN category
-		category_counts = {}
-		for species in self.results:
-			cat = species.get('iucn_category', 'Unknown')
-			category_counts[cat] = category_counts.get(cat, 0) + 1
-		
-		print("\nBy IUCN Red List Category:")
+		# Tally everything in one pass over the results file, keeping the first 3 species as examples
+		family_counts = Counter()
+		category_counts = Counter()
+		with_threats = 0
+		with_habitats = 0
+		examples = []
+		for species in load_results(self.results_path):
+			family_counts[species.get('family', 'Unknown')] += 1
+			category_counts[species.get('iucn_category', 'Unknown')] += 1
+			with_threats += bool(species.get('threats'))
+			with_habitats += bool(species.get('habitats'))
+			if len(examples) < 3:
+				examples.append(species)
+		
+		# Build the whole summary first and print it in one go
+		lines = ["\n" + "=" * 70, "SUMMARY", "=" * 70]
+		lines.append(f"\nTotal species found: {self.total_species}")
+		lines.append("\nBy family:")
+		lines.extend(f"  {family}: {count}" for family, count in sorted(family_counts.items()))
+		
+		lines.append("\nBy IUCN Red List Category:")
 		for cat in ['EX', 'EW', 'CR', 'EN', 'VU', 'NT']:
 			count = category_counts.get(cat, 0)
 			if count > 0:
-				print(f"  {cat}: {count}")
-		
-		# Count species with threat data
-		species_with_threats = [s for s in self.results if s.get('threats')]
-		print(f"\nSpecies with documented threats: {len(species_with_threats)}")
+				lines.append(f"  {cat}: {count}")
 		
-		# Count species with habitat data
-		species_with_habitats = [s for s in self.results if s.get('habitats')]
-		print(f"Species with habitat data: {len(species_with_habitats)}")
+		lines.append(f"\nSpecies with documented threats: {with_threats}")
+		lines.append(f"Species with habitat data: {with_habitats}")
 		
 		# Show examples
-		if self.results:
-			print(f"\nExample species (first 3):")
-			for i, species in enumerate(self.results[:3], 1):
-				print(f"\n  {i}. {species['scientific_name']}")
-				print(f"     Family: {species['family']}")
-				print(f"     IUCN: {species['iucn_category']}")
+		if examples:
+			lines.append(f"\nExample species (first 3):")
+			for i, species in enumerate(examples, 1):
+				lines.append(f"\n  {i}. {species['scientific_name']}")
+				lines.append(f"     Family: {species['family']}")
+				lines.append(f"     IUCN: {species['iucn_category']}")
 				
 				assessment = species.get('assessment', {})
 				if assessment:
 					pop_trend = assessment.get('population_trend', 'Unknown')
-					print(f"     Population trend: {pop_trend}")
+					lines.append(f"     Population trend: {pop_trend}")
 				
 				threats = species.get('threats', [])
 				if threats:
-					print(f"     Number of threats documented: {len(threats)}")
+					lines.append(f"     Number of threats documented: {len(threats)}")
+		
+		print("\n".join(lines))
 
 def main():
 	"""Main execution function."""
+	parser = argparse.ArgumentParser(description="Collect IUCN Red List conservation data for threatened bees.")
+	parser.add_argument('--token', default=os.environ.get('IUCN_API_TOKEN'), help="IUCN Red List API token (default: $IUCN_API_TOKEN)")
+	parser.add_argument('--refresh', action='store_true', help="clear the response cache and re-fetch everything")
+	parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="progress messages to show while collecting")
+	args = parser.parse_args()
+	if not args.token:
+		parser.error("an API token is required: pass --token or set IUCN_API_TOKEN")
 	
 	print("IUCN Red List API - Bee Conservation Data Collection")
 	print("\nThis script collects detailed conservation assessments for threatened bees.")
@@ -297,17 +463,21 @@ def main():
 	print("  - Conservation measures")
 	print()
 	
-	# Create collector (add your token here or pass as parameter)
-	collector = IUCNBeeData()
+	# Create collector
+	collector = IUCNBeeData(args.token)
 	
-	# Collect all data
-	collector.collect_all_bee_data()
+	# Collect all data, with progress logged from a background thread
+	listener = start_logging(logger, getattr(logging, args.log_level))
+	try:
+		collector.collect_all_bee_data(refresh=args.refresh)
+	finally:
+		listener.stop()
 	
 	# Print summary
 	collector.print_summary()
 	
 	# Save results if any
-	if collector.results:
+	if collector.total_species:
 		collector.save_results()
 	
 	print("\n" + "=" * 70)
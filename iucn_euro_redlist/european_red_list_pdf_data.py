@@ -5,14 +5,78 @@ Extracts only: CR, EN, VU, NT (excludes LC and DD species)
 """
 
 import json
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import List
+import pandas as pd
 from tabula.io import read_pdf
-import ipdb
-from collections import defaultdict
 import jpype
 
-TARGET_STATUSES = {'CR', 'EN', 'VU', 'NT'}
-ALL_STATUSES = {'CR', 'EN', 'VU', 'NT', 'DD', 'LC'}
+TARGET_STATUSES = frozenset(('CR', 'EN', 'VU', 'NT'))
+ALL_STATUSES = frozenset(('CR', 'EN', 'VU', 'NT', 'DD', 'LC'))
+_LCDD = frozenset(('LC', 'DD'))
+SPECIES_COLUMNS = ['genus', 'species', 'iucn_europe', 'iucn_eu_27', 'endemic_europe', 'endemic_eu27']
+# Token positions of SPECIES_COLUMNS for each shape of table line (keyed by token count)
+TOKEN_POSITIONS = {
+  6: [0, 1, 2, 3, 4, 5],
+  7: [0, 1, 2, 3, 5, 6],
+  8: [0, 1, 2, 4, 6, 7]
+}
+
+PDF_PATH = "red list euro bees.pdf"
+PDF_PAGE_COUNT = 36
+# Each worker starts its own JVM, so keep the pool small
+PDF_WORKERS = 4
+
+def page_ranges(page_count: int, workers: int) -> List[str]:
+  """Split pages 1..page_count into at most `workers` contiguous tabula page ranges."""
+  size = -(-page_count // workers)
+  return [f"{start}-{min(start + size - 1, page_count)}" for start in range(1, page_count + 1, size)]
+
+def read_pages(pages: str) -> List[pd.DataFrame]:
+  """Extract the tables from a range of PDF pages. Runs in a worker process."""
+  return read_pdf(PDF_PATH, pages=pages, multiple_tables=True, guess=False, stream=True)
+
+def parse_species_tables(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+  """
+  Flatten the tables tabula extracted into one species per row, tagged with its family.
+  """
+  # The first 5 rows of every table are headers. Cells are stringified ('nan' included)
+  # and re-split on whitespace, which normalizes the 6/7/8 column variants of the table.
+  tables = [df.iloc[5:].astype(str).fillna('nan') for df in dfs if len(df) > 5]
+  if not tables:
+    return pd.DataFrame(columns=SPECIES_COLUMNS + ['family'])
+  first_cells = pd.concat([df.iloc[:, 0] for df in tables], ignore_index=True)
+  lines = pd.concat([df.agg(' '.join, axis=1) for df in tables], ignore_index=True)
+  
+  # bogus parsing for end of current page (first digit is prob page number or something)
+  lines = lines[~first_cells.str.isdigit() & (lines.str.strip() != '')]
+  tokens = lines.str.split()
+  lengths = tokens.str.len()
+  
+  # Family header rows are a lone token or an all-caps first token
+  is_family = (lengths == 1) | tokens.str[0].str.isupper()
+  family = tokens.str[0].where(is_family)
+  
+  # The Melittidae header is lost in extraction, so its first genus starts the family
+  dasypoda = lines.index[lines.str.contains(r'(?:^|\s)Dasypoda(?:\s|$)')]
+  if len(dasypoda) and not is_family[dasypoda[0]]:
+    family[dasypoda[0]] = 'MELITTIDAE'
+  family = family.ffill()
+  
+  # Pick each column's token out of every line of the same shape at once
+  frames = []
+  for length, positions in TOKEN_POSITIONS.items():
+    rows = tokens[~is_family & (lengths == length)]
+    frame = pd.DataFrame({column: rows.str[i] for column, i in zip(SPECIES_COLUMNS, positions)}, index=rows.index)
+    if length == 7:
+      # we deliberate miss iucn_eu_27 data here: it's whichever of tokens 3 and 4 is filled
+      frame['iucn_eu_27'] = frame['iucn_eu_27'].where(frame['iucn_eu_27'] != 'nan', rows.str[4])
+    frames.append(frame)
+  
+  species = pd.concat(frames).sort_index()
+  species['family'] = family[species.index].astype(object).where(family.notna(), None)
+  return species.reset_index(drop=True)
 
 def main():
   """Main execution - parse the table and create JSON."""
@@ -27,70 +91,31 @@ def main():
 
 if __name__ == "__main__":
   
-  # Read tables from a PDF file
-  # 'data.pdf' is the path to your PDF file
-  # pages='all' extracts tables from all pages; specify page numbers if needed (e.g., pages='1-3')
-  species_list = []
-  dfs = read_pdf("red list euro bees.pdf", pages='all', multiple_tables=True, guess=False, stream=True)
-  # dfs will be a list of pandas DataFrames, where each DataFrame represents a table found in the PDF.
-  # You can then iterate through the list and process each DataFrame.
-  family_count, family_dd_count = 0, 0
-  family_name = None
-  genus, species, iucn_europe, iucn_eu_27, endemic_europe, endemic_eu27 = None, None, None, None, None, None
-  done = False
-  family_counts = defaultdict(dict)
-  for this_row, df in enumerate(dfs):
-   # print(f"Table {row+1}:\n")
-    for index, row in df.iterrows(): # type: ignore
-      if index < 5:
-        continue
-      
-      try:
-        data = [str(r) for r in row]
-        if data[0].isdigit(): # bogus parsing for end of current page (first digit is prob page number or something)
-          continue
-      except ValueError: # is NaN
-        continue
-
-      data = (" ".join(data)).split()
-
-      if "Dasypoda" in data and not done:
-        family_name = "MELITTIDAE"
-        family_counts[family_name] = defaultdict(int) 
-        family_count = 0
-        family_dd_count = 0
-        done = True
-      if len(data) == 1 or data[0].isupper():
-        family_name = data[0]
-        family_count = 0
-        family_dd_count = 0
-        family_counts[family_name] = defaultdict(int)
-        continue
-      elif len(data) == 6:
-        genus, species, iucn_europe, iucn_eu_27, endemic_europe, endemic_eu27 = data
-      elif len(data) == 7:
-        genus, species, iucn_europe, var_1, var_2, endemic_europe, endemic_eu27 = data # we deliberate miss iucn_eu_27 data here
-        iucn_eu_27 = var_2 if var_1 == 'nan' else var_1
-      elif len(data) == 8:
-        genus, species, iucn_europe, _, iucn_eu_27, _, endemic_europe, endemic_eu27 = data
-
-      if iucn_europe in TARGET_STATUSES:
-        family_counts[family_name]['Threatened'] += 1
-      else:
-        if iucn_europe in {'LC', 'DD'}:
-          family_counts[family_name][iucn_europe] += 1
-
-      species_list.append({
-        'scientific_name': f"{genus} {species}",
-        'family': family_name,
-        'iucn_europe_status': iucn_europe,
-        'iucn_eu_27_status': iucn_eu_27,
-        'endemic_to_europe': endemic_europe == "Yes",
-        'endemic_to_eu27': endemic_eu27 == "Yes"
-      })
-      
-      
-    #print("\n" + "="*30 + "\n")
+  # Read tables from the PDF, one slice of pages per worker process.
+  # executor.map keeps the slices in page order, which the family tagging relies on.
+  with ProcessPoolExecutor(max_workers=PDF_WORKERS) as executor:
+    chunks = executor.map(read_pages, page_ranges(PDF_PAGE_COUNT, PDF_WORKERS))
+    # dfs will be a list of pandas DataFrames, where each DataFrame represents a table found in the PDF.
+    dfs = [df for chunk in chunks for df in chunk]
+  species_df = parse_species_tables(dfs)
+  
+  species_list = [
+    {
+      'scientific_name': f"{row.genus} {row.species}",
+      'family': row.family,
+      'iucn_europe_status': row.iucn_europe,
+      'iucn_eu_27_status': row.iucn_eu_27,
+      'endemic_to_europe': row.endemic_europe == "Yes",
+      'endemic_to_eu27': row.endemic_eu27 == "Yes"
+    }
+    for row in species_df.itertuples(index=False)
+  ]
+  
+  # Per-family counts, with CR/EN/VU/NT folded into 'Threatened'
+  status_group = species_df['iucn_europe'].where(~species_df['iucn_europe'].isin(TARGET_STATUSES), 'Threatened')
+  status_group = status_group.where((status_group == 'Threatened') | status_group.isin(_LCDD))
+  family_counts = species_df.groupby(['family', status_group]).size().unstack(fill_value=0)
+  family_counts = family_counts.reindex(columns=['Threatened', 'LC', 'DD'], fill_value=0)
 
   if species_list:
     # Create output
@@ -109,10 +134,7 @@ if __name__ == "__main__":
       json.dump(output, f, indent=2, ensure_ascii=False)
     
     # Count by status
-    status_counts = defaultdict(int)
-    for sp in species_list:
-      status = sp['iucn_europe_status']
-      status_counts[status] += 1
+    status_counts = species_df['iucn_europe'].value_counts()
 
     print("\nBreakdown by conservation status:")
     for status in ALL_STATUSES:
@@ -123,24 +145,15 @@ if __name__ == "__main__":
     threatened_species = [s for s in species_list if s['iucn_europe_status'] in TARGET_STATUSES and s['iucn_eu_27_status'] in TARGET_STATUSES]
     
     print("\nBreakdown by family (Europe-wide status, ignoring EU-specific data here)")
-    total_dd_count = 0
-    total_count_all_families = 0
-    for family, counts in sorted(family_counts.items()):
-      dd_count = 0
-      total_count = sum(counts.values())
+    family_percentages = family_counts.div(family_counts.sum(axis=1), axis=0) * 100
+    for family, percentages in family_percentages.iterrows():
       print(f"  {family}")
-      for key, value in counts.items():
-        total_count_all_families += value
-        if key == 'DD':
-          dd_count += value
-
-      print(f"    % Data-Deficient: {round((dd_count / total_count) * 100, 1)}")
-      print(f"    % Threatened:     {round((counts['Threatened'] / total_count) * 100, 1)}")
-      print(f"    % Least Concern:  {round((counts['LC'] / total_count) * 100, 1)}")
-      total_dd_count += dd_count
-    print(f"\n DD % across all species: {(total_dd_count / total_count_all_families) * 100}")
-    endemic_europe_count = sum(1 for sp in species_list if sp['endemic_to_europe'])
-    endemic_eu_count = sum(1 for sp in species_list if sp['endemic_to_eu27'])
+      print(f"    % Data-Deficient: {round(percentages['DD'], 1)}")
+      print(f"    % Threatened:     {round(percentages['Threatened'], 1)}")
+      print(f"    % Least Concern:  {round(percentages['LC'], 1)}")
+    print(f"\n DD % across all species: {(family_counts['DD'].sum() / family_counts.values.sum()) * 100}")
+    endemic_europe_count = int((species_df['endemic_europe'] == "Yes").sum())
+    endemic_eu_count = int((species_df['endemic_eu27'] == "Yes").sum())
 
     print("\nBreakdown by Species Nativity")
     print(f"  Endemic to Europe: {endemic_europe_count} species")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Script to collect endangered bee species data from NatureServe Explorer API.
-Requires: requests library (pip install requests)
+Requires: aiohttp, aiohttp-client-cache, aiolimiter, orjson libraries (pip install aiohttp aiohttp-client-cache[sqlite] aiolimiter orjson)
 
 NatureServe Conservation Statuses:
 https://explorer.natureserve.org/AboutTheData/DataTypes/ConservationStatusCategories
@@ -11,16 +11,63 @@ NatureServe API docs:
 https://explorer.natureserve.org/api-docs/
 """
 
-import requests
-import json
-import time
+import aiohttp
+import argparse
+import asyncio
+import logging
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from aiolimiter import AsyncLimiter
+import orjson
+import math
 from typing import List, Dict, Optional
 from datetime import datetime
-import ipdb
-from collections import defaultdict
+import pathlib
+import shelve
+import sys
+from collections import Counter
+
+# Helpers shared by the collectors live at the top of the repository
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from api_helpers import (
+	conditional_headers, load_results, refresh_cached_response, remember_validators, retry_delay, start_logging
+)
 
 PER_PAGE_FAMILY_SEARCH = 100
 
+# Fields extract_conservation_info reads; search results that carry all of them
+# don't need a separate taxon lookup
+CONSERVATION_FIELDS = (
+	'scientificName', 'primaryCommonName', 'roundedGRank', 'grank', 'elementNationals', 'iucn',
+	'nameCategory', 'taxonomicComments', 'lastModified', 'uniqueId', 'nsxUrl'
+)
+
+# Cap on open NatureServe connections
+MAX_CONNECTIONS = 10
+
+# Requests per second sent to NatureServe
+NATURESERVE_REQUESTS_PER_SECOND = 2
+
+# Transient statuses worth retrying, waiting 1, 2, 4, 8 seconds between attempts
+# unless the server says how long to wait with Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 5
+
+# Species records are written here, one JSON object per line, as each family
+# completes; the collection metadata goes to a small file alongside
+RESULTS_PATH = 'natureserve_bees.jsonl'
+META_PATH = 'natureserve_bees.meta.json'
+
+# On-disk response cache. Failed lookups (404) are cached too, and responses
+# carrying their own Cache-Control/Expires headers follow those instead
+CACHE_NAME = 'natureserve_cache'
+CACHE_EXPIRE_AFTER = 86400 * 7
+
+# ETag/Last-Modified validators per URL, kept across cache expiry and --refresh
+# so unchanged resources come back as an empty 304 instead of a full download
+VALIDATORS_NAME = 'natureserve_validators'
+
+logger = logging.getLogger(__name__)
+
 class NatureServeBeeData:
 	
 	
@@ -29,8 +76,8 @@ class NatureServeBeeData:
 		
 		# NatureServe conservation status codes we care about
 		# G = Global, N = National, S = Subnational (state/province)
-		self.target_granks = ['GX', 'GH', 'G1', 'G2', 'G3']  # Extinct to Vulnerable globally
-		self.target_nranks = ['NX', 'NH', 'N1', 'N2', 'N3']  # National level
+		self.target_granks = frozenset(('GX', 'GH', 'G1', 'G2', 'G3'))  # Extinct to Vulnerable globally
+		self.target_nranks = frozenset(('NX', 'NH', 'N1', 'N2', 'N3'))  # National level
 		
 		# Map NatureServe ranks to IUCN-like categories
 		self.rank_map = {
@@ -57,24 +104,83 @@ class NatureServeBeeData:
 			'Stenotritidae'
 		]
 		
-		self.results = []
+		# Cache for taxon details, keyed by element UID
+		self.taxa = {}
+		
+		# Token bucket pacing every request to NatureServe
+		self.limiter = AsyncLimiter(NATURESERVE_REQUESTS_PER_SECOND, 1)
+		
+		# Requests wait here rather than in the connection pool, so queueing time
+		# doesn't count against a request's timeout
+		self.request_slots = asyncio.Semaphore(MAX_CONNECTIONS)
+		
+		self.results_path = RESULTS_PATH
+		self.total_species = 0
+		self.validators = {}
+	
+	async def _fetch_json(self, session: aiohttp.ClientSession, url: str, body: Optional[Dict] = None) -> Dict:
+		"""
+		GET a URL, or POST the JSON body to it when one is given, and decode the JSON response.
+		Rate limiting happens in _wait_for_rate_limit, as requests leave the cache.
+		Transient errors (RETRY_STATUSES) are retried after Retry-After or an exponential backoff.
+		A GET seen on an earlier run is revalidated; a 304 is answered from the stored body,
+		which also goes back into the response cache.
+		Raises aiohttp.ClientResponseError on a non-200 response; for a 400 its message is
+		the start of the response body.
+		"""
+		# Only GETs are revalidated; searches are POSTs
+		stored = self.validators.get(url) if body is None else None
+		
+		for attempt in range(MAX_ATTEMPTS):
+			async with self.request_slots:
+				async with session.request('POST' if body is not None else 'GET', url, json=body, headers=conditional_headers(stored)) as response:
+					if response.status == 304 and stored:
+						await refresh_cached_response(session, url, None, response, stored['body'])
+						return orjson.loads(stored['body'])
+					if response.status == 400:
+						# Carry the server's explanation of a rejected request, not just the reason phrase
+						raise aiohttp.ClientResponseError(
+							response.request_info,
+							response.history,
+							status=response.status,
+							message=(await response.text())[:500],
+							headers=response.headers
+						)
+					if response.status not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+						response.raise_for_status()
+						# Read the raw body so cached and live responses both decode with orjson
+						content = await response.read()
+						if body is None and not response.from_cache:
+							remember_validators(self.validators, url, response, content)
+						return orjson.loads(content)
+					delay = retry_delay(response.headers, 2 ** attempt)
+			await asyncio.sleep(delay)
 	
-	def get_taxon_by_uid(self, element_uid: str) -> Optional[Dict]:
+	async def _wait_for_rate_limit(self, session, trace_config_ctx, params):
+		"""
+		Request-start trace hook: take a token from the rate limiter.
+		Cache hits never start a real request, so they aren't rate limited.
+		"""
+		await self.limiter.acquire()
+	
+	async def get_taxon_by_uid(self, session: aiohttp.ClientSession, element_uid: str) -> Optional[Dict]:
 		"""
 		Get detailed information for a specific taxon using its Element Global UID.
+		A taxon turned up by more than one search is only fetched once.
 		"""
+		if element_uid in self.taxa:
+			return self.taxa[element_uid]
+		
 		endpoint = f"{self.base_url}/data/taxon/{element_uid}"
 		
 		try:
-			#ipdb.set_trace()
-			response = requests.get(endpoint, timeout=30)
-			#ipdb.set_trace()
-			if response.status_code == 200:
-				return response.json()
-			else:
-				print(f"    Error getting {element_uid}: HTTP {response.status_code}")
-		except requests.exceptions.RequestException as e:
-			print(f"    Request error for {element_uid}: {e}")
+			taxon_data = await self._fetch_json(session, endpoint)
+			self.taxa[element_uid] = taxon_data
+			return taxon_data
+		except aiohttp.ClientResponseError as e:
+			logger.error(f"    Error getting {element_uid}: HTTP {e.status}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.error(f"    Request error for {element_uid}: {e!r}")
 		
 		return None
 	
@@ -99,7 +205,7 @@ class NatureServeBeeData:
 		# Check global rank
 		if rounded_grank in self.target_granks:
 			is_threatened = True
-			conservation_status = self.rank_map.get(rounded_grank, rounded_grank)
+			conservation_status = self.rank_map[rounded_grank]
 		
 		# Also check national ranks
 		national_ranks = []
@@ -115,7 +221,7 @@ class NatureServeBeeData:
 					'nation': nation_name,
 					'rank': rounded_nrank,
 					'full_rank': nrank,
-					'status': self.rank_map.get(rounded_nrank, rounded_nrank)
+					'status': self.rank_map[rounded_nrank]
 				})
 		
 		if not is_threatened:
@@ -140,11 +246,11 @@ class NatureServeBeeData:
 			'ns_url': f"https://explorer.natureserve.org{taxon_data.get('nsxUrl', '')}"
 		}
 	
-	def search_bees_by_family(self, family_name: str) -> List[Dict]:
+	async def search_bees_by_family(self, session: aiohttp.ClientSession, family_name: str) -> List[Dict]:
 		"""
 		Search for all bee species in a given family using taxonomy criteria.
 		"""
-		print(f"\nSearching NatureServe for {family_name}...")
+		logger.info(f"\nSearching NatureServe for {family_name}...")
 		
 		endpoint = f"{self.base_url}/data/speciesSearch"
 		
@@ -195,123 +301,180 @@ class NatureServeBeeData:
 		threatened_species = []
 		
 		try:
-			response = requests.post(endpoint, json=search_body, timeout=30)
-			#ipdb.set_trace()
-			if response.status_code == 200:
-				data = response.json()
-				results = data.get('results', [])
+			data = await self._fetch_json(session, endpoint, search_body)
+			results = data.get('results', [])
+			
+			# The first page carries the total, so every other page can be requested at once.
+			# A page that fails is logged and skipped; the others are kept
+			total_results = data.get('resultsSummary', {}).get('totalResults', len(results))
+			num_pages = math.ceil(total_results / PER_PAGE_FAMILY_SEARCH)
+			pages = await asyncio.gather(*(
+				self._fetch_json(session, endpoint, {
+					**search_body,
+					'pagingOptions': {'page': page, 'recordsPerPage': PER_PAGE_FAMILY_SEARCH}
+				})
+				for page in range(1, num_pages)
+			), return_exceptions=True)
+			for page, page_data in enumerate(pages, 1):
+				if isinstance(page_data, aiohttp.ClientResponseError):
+					logger.error(f"  Error fetching page {page + 1} of {num_pages} for {family_name}: HTTP {page_data.status}")
+				elif isinstance(page_data, (aiohttp.ClientError, asyncio.TimeoutError)):
+					logger.error(f"  Request error on page {page + 1} of {num_pages} for {family_name}: {page_data!r}")
+				elif isinstance(page_data, BaseException):
+					raise page_data
+				else:
+					results.extend(page_data.get('results', []))
+			
+			logger.info(f"  Found {len(results)} total species in {family_name}")
+			
+			# statusCriteria already limits the search to threatened global ranks
+			for result in results:
+				scientific_name = result.get('scientificName', '')
+				logger.info(f"    → Threatened: {scientific_name} ({result.get('roundedGRank', '')})")
 				
-				print(f"  Found {len(results)} total species in {family_name}")
+				# Use the search record itself when it has everything we need,
+				# otherwise get full details
+				if all(field in result for field in CONSERVATION_FIELDS):
+					full_data = result
+				else:
+					element_uid = result.get('uniqueId', '')
+					full_data = await self.get_taxon_by_uid(session, element_uid) if element_uid else None
 				
-				for result in results:
-					# Check conservation status from search results
-					rounded_grank = result.get('roundedGRank', '')
-					
-					# Only process if it has a threatened status
-					if rounded_grank in self.target_granks:
-						scientific_name = result.get('scientificName', '')
-						print(f"    → Threatened: {scientific_name} ({rounded_grank})")
-						
-						# Get full details
-						element_uid = result.get('uniqueId', '')
-						if element_uid:
-							full_data = self.get_taxon_by_uid(element_uid)
-							
-							if full_data:
-								conservation_info = self.extract_conservation_info(full_data)
-								if conservation_info:
-									conservation_info['family'] = family_name
-									threatened_species.append(conservation_info)
-							
-							time.sleep(0.5)  # Rate limiting
-			else:
-				print(f"  Error: HTTP {response.status_code}")
-				if response.status_code == 400:
-					print(f"  Response: {response.text[:500]}")
-					
-		except requests.exceptions.RequestException as e:
-			print(f"  Request error: {e}")
+				if full_data:
+					conservation_info = self.extract_conservation_info(full_data)
+					if conservation_info:
+						conservation_info['family'] = family_name
+						threatened_species.append(conservation_info)
+		except aiohttp.ClientResponseError as e:
+			logger.error(f"  Error: HTTP {e.status}")
+			if e.status == 400:
+				logger.error(f"  Response: {e.message}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.error(f"  Request error: {e!r}")
 		
 		return threatened_species
 	
-	def collect_all_bee_data(self):
+	async def _collect_async(self, refresh: bool = False):
+		"""
+		Search every bee family over one shared, cached HTTP session.
+		With refresh, the response cache is cleared first.
+		"""
+		# Pooled keep-alive connections, so only the first request pays for the TLS handshake
+		connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=MAX_CONNECTIONS, keepalive_timeout=60)
+		timeout = aiohttp.ClientTimeout(total=30)
+		headers = {'Accept-Encoding': 'gzip', 'User-Agent': 'wild_bees/1.0'}
+		cache = SQLiteBackend(
+			cache_name=CACHE_NAME,
+			expire_after=CACHE_EXPIRE_AFTER,
+			allowed_codes=(200, 404),
+			allowed_methods=('GET', 'POST'),  # Species searches are POSTs; the JSON body is part of the key
+			cache_control=True
+		)
+		
+		trace_config = aiohttp.TraceConfig()
+		trace_config.on_request_start.append(self._wait_for_rate_limit)
+		
+		async with CachedSession(cache=cache, connector=connector, timeout=timeout, headers=headers, trace_configs=[trace_config]) as session:
+			if refresh:
+				await session.cache.clear()
+			
+			# All families are searched at once; the shared limiter keeps the
+			# combined traffic at NATURESERVE_REQUESTS_PER_SECOND
+			searches = [self.search_bees_by_family(session, family) for family in self.bee_families]
+			for family_search in asyncio.as_completed(searches):
+				self.record_results(await family_search)
+	
+	def collect_all_bee_data(self, refresh: bool = False):
 		"""
 		Main function to collect conservation data for all bee families.
+		Pass refresh=True to ignore previously cached responses.
 		"""
 		print("=" * 70)
 		print("NATURESERVE BEE CONSERVATION DATA COLLECTION")
 		print("=" * 70)
 		
-		for family in self.bee_families:
-			family_species = self.search_bees_by_family(family)
-			self.results.extend(family_species)
-			time.sleep(1)  # Be respectful with rate limiting
+		with open(self.results_path, 'wb') as self._out, shelve.open(VALIDATORS_NAME) as self.validators:
+			asyncio.run(self._collect_async(refresh))
 		
-		print(f"\n\n{'='*70}")
-		print(f"Total threatened bee species found: {len(self.results)}")
-		print(f"{'='*70}")
+		logger.info(f"\n\n{'='*70}")
+		logger.info(f"Total threatened bee species found: {self.total_species}")
+		logger.info(f"{'='*70}")
 		
-		return self.results
+		return self.total_species
 	
-	def save_results(self, filename: str = 'natureserve_bees.json'):
-		"""Save results to a JSON file."""
+	def record_results(self, species_list: List[Dict]):
+		"""
+		Append a family's species records to the results file in a single write.
+		"""
+		if not species_list:
+			return
+		self._out.write(b''.join(orjson.dumps(species, option=orjson.OPT_NON_STR_KEYS) + b'\n' for species in species_list))
+		self.total_species += len(species_list)
+	
+	def save_results(self, filename: str = META_PATH):
+		"""
+		Save the collection metadata to a JSON file.
+		The species records themselves are already in the results file.
+		"""
 		output = {
 			'collection_date': datetime.now().isoformat(),
-			'total_species': len(self.results),
+			'total_species': self.total_species,
 			'data_source': 'NatureServe Explorer',
-			'species': self.results
+			'species_file': self.results_path
 		}
 		
-		with open(filename, 'w', encoding='utf-8') as f:
-			json.dump(output, f, indent=2, ensure_ascii=False)
+		with open(filename, 'wb') as f:
+			f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 		
 		print(f"\n✓ Results saved to {filename}")
 	
 	def print_summary(self):
 		"""Print a summary of collected data."""
-		print("\n" + "=" * 70)
-		print("SUMMARY")
-		print("=" * 70)
-		
-		# Count by family
-		family_counts = defaultdict(int)
-		for species in self.results:
-			family = species.get('family', 'Unknown')
-			family_counts[family] += 1
-		
-		print(f"\nTotal species found: {len(self.results)}")
-		print("\nBy family:")
-		for family, count in sorted(family_counts.items()):
-			print(f"  {family}: {count}")
+		# Tally everything in one pass over the results file, keeping the first 5 species as examples
+		family_counts = Counter()
+		status_counts = Counter()
+		examples = []
+		for species in load_results(self.results_path):
+			family_counts[species.get('family', 'Unknown')] += 1
+			status_counts[species.get('conservation_status', 'Unknown')] += 1
+			if len(examples) < 5:
+				examples.append(species)
 		
-		# Count by conservation status
-		status_counts = defaultdict(int)
-		for species in self.results:
-			status = species.get('conservation_status', 'Unknown')
-			status_counts[status] += 1
+		# Build the whole summary first and print it in one go
+		lines = ["\n" + "=" * 70, "SUMMARY", "=" * 70]
+		lines.append(f"\nTotal species found: {self.total_species}")
+		lines.append("\nBy family:")
+		lines.extend(f"  {family}: {count}" for family, count in sorted(family_counts.items()))
 		
-		print("\nBy conservation status:")
+		lines.append("\nBy conservation status:")
 		for status in ['EX', 'EW', 'CR', 'EN', 'VU']:
 			count = status_counts.get(status, 0)
 			if count > 0:
-				print(f"  {status}: {count}")
+				lines.append(f"  {status}: {count}")
 		
 		# Show some examples
-		if self.results:
-			print(f"\nExample species (showing first 5 of {len(self.results)}):")
-			for i, species in enumerate(self.results[:5], 1):
-				print(f"\n  {i}. {species['scientific_name']}")
+		if examples:
+			lines.append(f"\nExample species (showing first 5 of {self.total_species}):")
+			for i, species in enumerate(examples, 1):
+				lines.append(f"\n  {i}. {species['scientific_name']}")
 				if species.get('common_name'):
-					print(f"     Common name: {species['common_name']}")
-				print(f"     Family: {species['family']}")
-				print(f"     Global rank: {species['global_rank_full']} ({species['conservation_status']})")
+					lines.append(f"     Common name: {species['common_name']}")
+				lines.append(f"     Family: {species['family']}")
+				lines.append(f"     Global rank: {species['global_rank_full']} ({species['conservation_status']})")
 				if species.get('national_ranks'):
 					for nat_rank in species['national_ranks'][:2]:  # Show first 2
-						print(f"     {nat_rank['nation']}: {nat_rank['full_rank']} ({nat_rank['status']})")
-				print(f"     URL: {species['ns_url']}")
+						lines.append(f"     {nat_rank['nation']}: {nat_rank['full_rank']} ({nat_rank['status']})")
+				lines.append(f"     URL: {species['ns_url']}")
+		
+		print("\n".join(lines))
 
 def main():
 	"""Main execution function."""
+	parser = argparse.ArgumentParser(description="Collect NatureServe conservation data for threatened bees.")
+	parser.add_argument('--refresh', action='store_true', help="clear the response cache and re-fetch everything")
+	parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="progress messages to show while collecting")
+	args = parser.parse_args()
+	
 	collector = NatureServeBeeData()
 	
 	print("NatureServe Explorer API - Bee Conservation Status")
@@ -324,8 +487,12 @@ def main():
 	print("  G3/N3 = Vulnerable")
 	print()
 	
-	# Collect all data
-	collector.collect_all_bee_data()
+	# Collect all data, with progress logged from a background thread
+	listener = start_logging(logger, getattr(logging, args.log_level))
+	try:
+		collector.collect_all_bee_data(refresh=args.refresh)
+	finally:
+		listener.stop()
 	
 	# Print summary
 	collector.print_summary()
@@ -337,7 +504,7 @@ def main():
 	print("DATA COLLECTION COMPLETE")
 	print("=" * 70)
 	print("\nNext steps:")
-	print("1. Review natureserve_bees.json for detailed species information")
+	print("1. Review natureserve_bees.jsonl for detailed species information")
 	print("2. Cross-reference with iNaturalist data for observation records")
 	print("3. Check NatureServe URLs for full conservation assessments")
 